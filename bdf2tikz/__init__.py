@@ -1,2 +1,8 @@
-__all__ = ["process", "render", "parser", "utils"]
-from . import *
+__all__ = ["process", "render", "parser", "batch", "cache", "profile", "spatial", "nets", "server", "client", "watch", "incremental", "utils"]
+
+# submodules are imported on first access, so that importing the package is cheap
+def __getattr__(name):
+  if name in __all__:
+    import importlib
+    return importlib.import_module("." + name, __name__)
+  raise AttributeError("module %r has no attribute %r" % (__name__, name))
@@ -0,0 +1,120 @@
+# Copyright 2016 Alba Mendez <me@alba.sh>
+#
+# This file is part of bdf2tikz.
+#
+# bdf2tikz is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# bdf2tikz is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with bdf2tikz.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Batch conversion of many schematics (i.e. a whole Quartus project),
+spread over a pool of worker processes.
+"""
+
+import os
+import glob
+import time
+import traceback
+from .process import render_bdf_to, map_input, atomic_output
+
+INPUT_EXTENSIONS = (".bdf", ".bsf")
+
+def is_input_file(path):
+  return path.lower().endswith(INPUT_EXTENSIONS)
+
+def find_inputs(patterns):
+  """ Expand directories (recursively) and glob patterns into a list of
+      (input path, path relative to the directory or pattern root) tuples. """
+  result = []
+  for pattern in patterns:
+    if os.path.isdir(pattern):
+      for root, dirs, files in os.walk(pattern):
+        dirs.sort()
+        for name in sorted(files):
+          if is_input_file(name):
+            path = os.path.join(root, name)
+            result.append((path, os.path.relpath(path, pattern)))
+    elif glob.has_magic(pattern):
+      # the root is the part of the pattern before the first wildcard
+      root = pattern
+      while glob.has_magic(root): root = os.path.dirname(root)
+      for path in sorted(glob.glob(pattern, recursive=True)):
+        if os.path.isfile(path) and is_input_file(path):
+          result.append((path, os.path.relpath(path, root or ".")))
+    else:
+      result.append((pattern, os.path.basename(pattern)))
+  return result
+
+def get_output_path(relative, output_dir):
+  """ foo.bdf is rendered into foo.tex, and foo.bsf (the symbol of the same
+      block, usually next to it) into foo.bsf.tex. """
+  base, extension = os.path.splitext(relative)
+  if extension.lower() == ".bsf": base = relative
+  return os.path.join(output_dir, base + ".tex")
+
+def find_duplicate_outputs(jobs):
+  """ Returns {output: [inputs]} for the outputs that more than one of
+      the passed (input, output) jobs would write (i.e. inputs with the
+      same relative path under different directories). """
+  inputs = {}
+  for input, output in jobs:
+    inputs.setdefault(os.path.normcase(os.path.abspath(output)), []).append(input)
+  return {output: inputs[output] for output in inputs if len(inputs[output]) > 1}
+
+def convert_file(input, output, options, cache=None):
+  """ Render one file, returning (input, output, elapsed seconds, error).
+      error is None on success, or a formatted traceback. """
+  start = time.perf_counter()
+  try:
+    directory = os.path.dirname(output)
+    if directory: os.makedirs(directory, exist_ok=True)
+    # on errors, any previous output is left as it was
+    with map_input(input) as rs, atomic_output(output) as stream:
+      render_bdf_to(stream, rs, options, cache)
+    error = None
+  except Exception:
+    error = traceback.format_exc()
+  return (input, output, time.perf_counter() - start, error)
+
+worker_cache = None
+
+def init_worker(cache):
+  global worker_cache
+  worker_cache = cache
+
+def convert_file_in_worker(input, output, options):
+  return convert_file(input, output, options, worker_cache)
+
+def convert_batch(jobs, options, workers=None, callback=None, cache=None):
+  """ Render a list of (input, output) paths using `workers` processes
+      (None means one per CPU, 1 renders in this process). A failed file
+      doesn't abort the batch. callback, if passed, is called with each
+      result of convert_file, in order, as soon as it's available.
+      cache is an optional RenderCache, shared by all workers.
+      Returns the list of results, in the order of jobs. """
+  if workers == 1:
+    results = []
+    for input, output in jobs:
+      results.append(convert_file(input, output, options, cache))
+      if callback: callback(results[-1])
+    return results
+
+  # the cache is passed once to each worker (rather than pickled with each
+  # job), so that it keeps its state (i.e. its size estimate) between jobs
+  from concurrent.futures import ProcessPoolExecutor
+  with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(cache,)) as executor:
+    futures = [executor.submit(convert_file_in_worker, input, output, options) for input, output in jobs]
+    results = []
+    for future in futures:
+      results.append(future.result())
+      if callback: callback(results[-1])
+  return results
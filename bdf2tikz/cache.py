@@ -0,0 +1,129 @@
+# Copyright 2016 Alba Mendez <me@alba.sh>
+#
+# This file is part of bdf2tikz.
+#
+# bdf2tikz is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# bdf2tikz is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with bdf2tikz.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+On-disk cache of rendered output, so that unchanged schematics don't
+need to be parsed and rendered again.
+
+Entries are keyed by a hash of the input bytes, the options and the
+bdf2tikz code itself, and evicted in LRU order (by modification time,
+which is refreshed on every hit) when the cache exceeds its size.
+
+Each RenderCache instance only scans the directory on its first write,
+and then when the size of the entries it wrote since (tracked in memory)
+takes it over the limit. Eviction leaves some room below the limit, so
+that scans are rare. Batch workers each keep one instance for all their
+jobs, so they scan once each, but they don't see each other's writes: the
+cache can go over the limit for a while, until one of them scans it.
+"""
+
+import os
+import json
+import hashlib
+import tempfile
+
+_code_version = None
+
+def get_code_version():
+  """ Digest of the bdf2tikz sources, so that entries are invalidated
+      whenever the code that produced them changes. """
+  global _code_version
+  if _code_version is None:
+    digest = hashlib.sha256()
+    package = os.path.dirname(os.path.abspath(__file__))
+    for root, dirs, files in os.walk(package):
+      dirs.sort()
+      for name in sorted(files):
+        if name.endswith(".py"):
+          path = os.path.join(root, name)
+          digest.update(os.path.relpath(path, package).encode("utf-8") + b"\0")
+          digest.update(open(path, "rb").read() + b"\0")
+    _code_version = digest.hexdigest()
+  return _code_version
+
+class RenderCache(object):
+  # fraction of max_size that eviction leaves the cache at
+  evict_target = 0.9
+
+  def __init__(self, directory, max_size=256 * 1024 * 1024):
+    self.directory = directory
+    self.max_size = max_size
+    self.size = None  # estimated size of the entries, None until scanned
+
+  def get_key(self, rs, options):
+    digest = hashlib.sha256()
+    digest.update(get_code_version().encode("ascii") + b"\0")
+    digest.update(json.dumps(options, sort_keys=True, default=repr).encode("utf-8") + b"\0")
+    digest.update(rs)
+    return digest.hexdigest()
+
+  def get_path(self, key):
+    return os.path.join(self.directory, key + ".tex")
+
+  def get(self, key):
+    """ Returns the cached output, or None on a miss. """
+    path = self.get_path(key)
+    try:
+      with open(path, "r") as f:
+        output = f.read()
+      os.utime(path, None)
+    except (IOError, OSError):
+      return None
+    return output
+
+  def put(self, key, output):
+    os.makedirs(self.directory, exist_ok=True)
+    # write to a temporary file first, so that concurrent readers
+    # (i.e. other batch workers) never see a partial entry
+    fd, temp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+    try:
+      with os.fdopen(fd, "w") as f:
+        f.write(output)
+      size = os.stat(temp).st_size
+      os.replace(temp, self.get_path(key))
+    except:
+      os.remove(temp)
+      raise
+    # (replacing an existing entry is counted twice, which only
+    # makes the next scan come a bit earlier)
+    if self.size is not None: self.size += size
+    if self.size is None or self.size > self.max_size:
+      self.evict()
+
+  def evict(self):
+    """ Scan the cache, and if it's over max_size, remove least recently
+        used entries until it's down to evict_target of it. """
+    entries = []
+    total = 0
+    for name in os.listdir(self.directory):
+      if not name.endswith(".tex"): continue
+      try:
+        stat = os.stat(os.path.join(self.directory, name))
+      except OSError:
+        continue
+      entries.append((stat.st_mtime, stat.st_size, name))
+      total += stat.st_size
+    entries.sort()
+    if total > self.max_size:
+      for mtime, size, name in entries:
+        if total <= self.max_size * self.evict_target: break
+        try:
+          os.remove(os.path.join(self.directory, name))
+        except OSError:
+          pass
+        total -= size
+    self.size = total
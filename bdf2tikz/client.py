@@ -0,0 +1,38 @@
+# Copyright 2016 Alba Mendez <me@alba.sh>
+#
+# This file is part of bdf2tikz.
+#
+# bdf2tikz is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# bdf2tikz is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with bdf2tikz.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Client side of the conversion server (see server.py). It only depends on
+the standard library, so that it starts fast.
+"""
+
+import os
+import json
+import socket
+import tempfile
+
+def get_default_socket():
+  return os.environ.get("BDF2TIKZ_SOCKET") or os.path.join(tempfile.gettempdir(), "bdf2tikz-%d.sock" % os.getuid())
+
+def request(path, request):
+  """ Send a request to the server listening at path, and return the response. """
+  with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+    client.connect(path)
+    client.sendall((json.dumps(request) + "\n").encode("utf-8"))
+    client.shutdown(socket.SHUT_WR)
+    with client.makefile("rb") as f:
+      return json.loads(f.readline().decode("utf-8"))
@@ -0,0 +1,121 @@
+# Copyright 2016 Alba Mendez <me@alba.sh>
+#
+# This file is part of bdf2tikz.
+#
+# bdf2tikz is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# bdf2tikz is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with bdf2tikz.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Incremental rendering: keeps the output fragments of the last render of a
+sheet, so that rendering it again after an edit only renders the objects
+that changed, and the runs of the nets they touch.
+
+    renderer = IncrementalRenderer(options)
+    output = renderer.render(rs)
+    ...
+    output = renderer.render(edited_rs)  # same as render_bdf(edited_rs, options)
+
+Objects are diffed by identity, as returned by parser.ObjectCache (which
+keeps the objects whose source didn't change). Runs are diffed by net: the
+lines are grouped by the points they share, which is how trace_line_runs
+follows them, and the runs of a net are only traced again if its lines
+changed. Warnings are only printed when a fragment is rendered, not when
+it's reused.
+"""
+
+from . import parser, render, spatial
+from .nets import find
+from .process import iter_render_objects, ResolvedTemplates
+from .profile import NULL_PROFILE
+
+def group_lines(lines):
+  """ Group lines into nets (lines joined at their ends). Returns the nets
+      as lists of lines in their original order, in the order their runs
+      are traced (by descending index of their last line). """
+  parents = list(range(len(lines)))
+  points = {}
+  for i, line in enumerate(lines):
+    for point in line[:2]:
+      j = points.setdefault(point, i)
+      if j != i:
+        a, b = find(parents, i), find(parents, j)
+        if a != b: parents[a] = b
+  nets = {}
+  for i, line in enumerate(lines):
+    nets.setdefault(find(parents, i), []).append(i)
+  order = sorted(nets.values(), key=lambda net: net[-1], reverse=True)
+  return [[lines[i] for i in net] for net in order]
+
+class IncrementalRenderer(object):
+  """ Renders successive versions of a sheet with the same options. """
+  def __init__(self, options):
+    self.options = options
+    self.context = render.RenderContext(options)
+    self.object_cache = parser.ObjectCache()
+    self.fragments = {}
+    self.runs = {}
+
+  def render(self, rs, profile=None):
+    """ Equivalent to render_bdf(rs, options). """
+    return "".join(self.iter_render(rs, profile))
+
+  def iter_render(self, rs, profile=None):
+    """ Equivalent to iter_render_bdf(rs, options). """
+    profile = profile or NULL_PROFILE
+    with profile.stage("parse (object cache)"):
+      objects = self.object_cache.parse_bdf(rs)
+    templates = None
+    if self.options.get("symbol_templates"):
+      with profile.stage("symbol_templates"):
+        templates = render.SymbolTemplates([thing for thing in objects if isinstance(thing, parser.Symbol)])
+
+    # fragments are (chunks, lines, complementary chunks) of each object,
+    # keyed by its identity (and for symbols, the pic lookup, which
+    # depends on the symbols before it)
+    fragments, lines, complementary_output = {}, [], []
+    render_objects = profile.stage("render objects (changed)")
+    for thing in objects:
+      lookup = templates.lookup(thing) if templates and isinstance(thing, parser.Symbol) else None
+      key = (id(thing), lookup)
+      fragment = fragments.get(key) or self.fragments.get(key)
+      if fragment is None or fragment[0] is not thing:
+        with render_objects:
+          object_lines, object_output = [], []
+          resolved = None if lookup is None else ResolvedTemplates([lookup])
+          chunks = list(iter_render_objects([thing], self.context, object_lines, object_output, resolved))
+          fragment = (thing, chunks, object_lines, object_output)
+      fragments[key] = fragment
+      for chunk in fragment[1]:
+        yield chunk
+      lines += fragment[2]
+      complementary_output += fragment[3]
+    self.fragments = fragments
+
+    if self.options.get("split_t_junctions"):
+      with profile.stage("split_t_junctions"):
+        lines = spatial.split_t_junctions(lines)
+    with profile.stage("group_lines"):
+      nets = group_lines(lines)
+    runs, render_runs = {}, profile.stage("render runs (changed)")
+    for net in nets:
+      key = tuple(net)
+      chunks = runs.get(key) or self.runs.get(key)
+      if chunks is None:
+        with render_runs:
+          chunks = [render.render_line_run(run, self.context) for run in render.trace_line_runs(net)]
+      runs[key] = chunks
+      for chunk in chunks:
+        yield chunk
+    self.runs = runs
+    for chunk in complementary_output:
+      yield chunk
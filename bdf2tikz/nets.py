@@ -0,0 +1,142 @@
+# Copyright 2016 Alba Mendez <me@alba.sh>
+#
+# This file is part of bdf2tikz.
+#
+# bdf2tikz is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# bdf2tikz is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with bdf2tikz.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Connectivity of a schematic, without rendering it: the segments of
+connectors, pins and symbol ports are grouped into nets (sets of segments
+joined at their ends) using union-find, and the width of each net is
+inferred from the names of its pins, ports and labels.
+
+    nets = extract_nets(parse_bdf(rs))
+    for net in nets:
+      if net.mismatches: ...
+    for point, joined in get_unjoined_junctions(nets).items(): ...
+"""
+
+from . import parser
+from .render import get_name_width, node_name_errors, join_widths, get_pin_line, get_port_line, is_primitive
+from .spatial import split_t_junctions, find_point_runs
+
+class Net(object):
+  """ segments: list of (p1, p2) segments, in sheet coordinates
+      pins: list of (pin name, direction) attached to the net
+      ports: list of (symbol instance name, port name, direction)
+      labels: list of connector label texts
+      width: inferred width (None if unknown, 1 for single nodes)
+      mismatches: list of (point, width, other width) inconsistencies
+      junctions: points of the junctions lying on the net """
+  __slots__ = ("segments", "pins", "ports", "labels", "width", "mismatches", "junctions")
+  def __init__(self):
+    self.segments = []
+    self.pins = []
+    self.ports = []
+    self.labels = []
+    self.width = None
+    self.mismatches = []
+    self.junctions = []
+
+  def __repr__(self):
+    return "<Net width=%r, %d segments, pins=%r, ports=%r, labels=%r>" % (self.width, len(self.segments), self.pins, self.ports, self.labels)
+
+def find(parents, i):
+  # find with path halving
+  while parents[i] != i:
+    parents[i] = parents[parents[i]]
+    i = parents[i]
+  return i
+
+def get_width(name):
+  try:
+    return get_name_width(name)
+  except node_name_errors():
+    return None
+
+def collect_segments(schematic):
+  """ Returns the segments of the schematic as (p1, p2, width, flags, owner)
+      tuples in sheet order, where flags are the ones used by
+      split_t_junctions and owner is a ("pin" | "port" | "label", ...) tuple
+      or None. """
+  if hasattr(schematic, "filter"):
+    schematic = schematic.filter(parser.Pin, parser.Symbol, parser.Connector)
+  segments = []
+  for thing in schematic:
+    if isinstance(thing, parser.Pin):
+      if thing.direction not in ("input", "output"): continue
+      entry, connection = get_pin_line(thing)
+      segments.append((entry, connection, get_width(thing.name.text), False, True, ("pin", thing.name.text, thing.direction)))
+    elif isinstance(thing, parser.Symbol):
+      # ports of primitives don't tell the width
+      primitive = is_primitive(thing)
+      for port in thing.ports:
+        p, p2 = get_port_line(thing, port)
+        segments.append((p, p2, None if primitive else get_width(port.text2.text), False, True, ("port", thing.name.text, port.text2.text, port.direction)))
+    elif isinstance(thing, parser.Connector):
+      label = thing.label.text if thing.label else None
+      width = get_width(label) if label else None
+      segments.append((thing.p1, thing.p2, width, False, False, ("label", label) if label else None))
+  return segments
+
+def extract_nets(schematic, split_t=False):
+  """ Returns the nets of a schematic (list of objects, or LazySchematic),
+      as a list of Net objects in the order of their first segment.
+      If split_t is set, segments ending in the middle of a connector are
+      connected to it (see spatial.split_t_junctions). """
+  if hasattr(schematic, "filter"):
+    junctions = [j.p for j in schematic.filter(parser.Junction)]
+  else:
+    junctions = [j.p for j in schematic if isinstance(j, parser.Junction)]
+  segments = collect_segments(schematic)
+  if split_t: segments = split_t_junctions(segments)
+
+  # union segments sharing an end
+  parents = list(range(len(segments)))
+  first = {}
+  for i, segment in enumerate(segments):
+    for point in segment[:2]:
+      j = first.setdefault(point, i)
+      if j != i:
+        a, b = find(parents, i), find(parents, j)
+        if a != b: parents[max(a, b)] = min(a, b)
+
+  nets, segment_nets = {}, []
+  for i, (p1, p2, width, _, _, owner) in enumerate(segments):
+    root = find(parents, i)
+    net = nets.get(root)
+    if net is None: net = nets[root] = Net()
+    segment_nets.append(net)
+    net.segments.append((p1, p2))
+    net.width = join_widths(p1, net.width, width, net.mismatches)
+    if owner is None: continue
+    if owner[0] == "pin": net.pins.append(owner[1:])
+    elif owner[0] == "port": net.ports.append(owner[1:])
+    elif owner[1] not in net.labels: net.labels.append(owner[1])
+
+  # junctions, found on the segments passing through them
+  for point, found in zip(junctions, find_point_runs(junctions, [segment[:2] for segment in segments])):
+    for net in {id(segment_nets[i]): segment_nets[i] for i in found}.values():
+      net.junctions.append(point)
+  return list(nets.values())
+
+def get_unjoined_junctions(nets):
+  """ Returns {point: [nets]} for the junctions lying on more than one net,
+      where lines are drawn as joined but aren't connected (i.e. T
+      connections, unless extract_nets is called with split_t). """
+  found = {}
+  for net in nets:
+    for point in net.junctions:
+      found.setdefault(point, []).append(net)
+  return {point: found[point] for point in found if len(found[point]) > 1}
@@ -15,48 +15,89 @@
 # You should have received a copy of the GNU General Public License
 # along with bdf2tikz.  If not, see <http://www.gnu.org/licenses/>.
 
-from pyparsing import ZeroOrMore
-from .utils.sexp import sexp
-import traceback
+from .utils import lexer
 import re
-import pprint
+import operator
+from itertools import islice
 
 class ParseError(Exception):
   def __init__(self, reason):
     Exception.__init__(self, u"Malformed BDF file: %s" % (reason,))
 
+class ObjectParseError(ParseError):
+  """ Raised when an object couldn't be interpreted because of an unexpected
+      exception. The message (with the object and the original traceback)
+      is only formatted when it's actually needed. """
+  def __init__(self, name, object, cause):
+    Exception.__init__(self, name, object, cause)
+    self.name, self.object, self.cause = name, object, cause
+  def __str__(self):
+    import traceback
+    cause = u"".join(traceback.format_exception(type(self.cause), self.cause, self.cause.__traceback__))
+    return u"Malformed BDF file: Couldn't parse %s %s:\n%s" % (self.name, repr(self.object[1:]), cause)
+
 SUPPORTED_HEADERS = {
   u"graphic": [u"1.3", u"1.4"],
   u"symbol": [u"1.1"],
 }
 
-def parse_bdf(input):
-  # Decode in ASCII (FIXME)
-  try:
-    input = input.decode("ascii")
-  except UnicodeDecodeError as e:
-    raise ParseError("Non-ASCII content")
+def parse_bdf(input, strict=False):
+  return interpret_bdf(parse_bdf_sexps(input, strict))
 
-  # Remove starting comments, if present
-  while True:
-    input = input.lstrip()
-    if input.startswith(u"/*"):
-      input = input[2:]
-      idx = input.find(u"*/")
-      if idx == -1: raise ParseError(u"Unterminated comment")
-      input = input[idx+2:]
-    elif input.startswith(u"//"):
-      input = input[2:]
-      idx = input.find(u"\n")
-      if idx == -1: idx = len(input)
-      input = input[idx+1:]
-    else: break
+def parse_bdf_lazy(input, strict=False):
+  """ Like parse_bdf, but objects are only interpreted when accessed,
+      see LazySchematic. """
+  return LazySchematic(parse_bdf_sexps(input, strict))
 
+def parse_bdf_sexps(input, strict=False):
+  """ Returns the S-expressions of the objects, header already validated.
+      input can be bytes or any bytes-like object, i.e. an mmap of the file. """
   # Parse S-expressions, validate and strip header
-  parsed = ZeroOrMore(sexp).parseString(input, parseAll=True).asList()
+  parsed = parse_sexps(input, strict, find_bdf_start(input))
   validate_header(parsed)
+  return parsed
 
-  return interpret_bdf(parsed)
+NON_ASCII = re.compile(b"[^\x00-\x7f]")
+LEADING_COMMENTS = re.compile(br"(?:\s+|/\*.*?\*/|//[^\n]*(?:\n|$))*", re.S)
+
+def find_bdf_start(input):
+  """ Checks the BDF contents (bytes-like) and returns the offset of the
+      first S-expression, skipping leading comments without copying. """
+  # Only ASCII is supported (FIXME)
+  if NON_ASCII.search(input):
+    raise ParseError("Non-ASCII content")
+  return skip_leading_comments(input)
+
+def skip_leading_comments(input, start=0):
+  """ Returns the offset of the first S-expression in a bytes-like object,
+      after any comments (and whitespace) found from offset start. """
+  start = LEADING_COMMENTS.match(input, start).end()
+  if input[start:start+2] == b"/*": raise ParseError(u"Unterminated comment")
+  return start
+
+def strip_leading_comments(input):
+  """ Remove comments (and whitespace) found before the first S-expression
+      of a string. """
+  return input[skip_leading_comments(input.encode("ascii")):]
+
+def parse_sexps(input, strict=False, start=0):
+  """ Parse S-expressions (in a string, or bytes-like object from offset start)
+      using the fast lexer. If strict is set, or the input uses syntax the
+      lexer doesn't handle, the full pyparsing grammar is used. """
+  if not strict:
+    try:
+      return lexer.parse_sexps(input, start)
+    except lexer.UnsupportedSyntax:
+      pass
+    except lexer.SexpError as e:
+      raise ParseError(str(e))
+  try:
+    from pyparsing import ZeroOrMore
+    from .utils.sexp import sexp
+  except ImportError:
+    raise ParseError(u"Unsupported S-expression syntax (install pyparsing to parse it)")
+  input = input[start:] if isinstance(input, str) else bytes(input[start:]).decode("ascii")
+  return ZeroOrMore(sexp).parseString(input, parseAll=True).asList()
 
 def validate_header(parsed):
   if len(parsed) == 0 or parsed[0][:1] != [u"header"]:
@@ -70,48 +111,143 @@ def validate_header(parsed):
 
 def interpret_bdf(parsed):
   objects = list(map(parse_object, parsed))
-  for i in objects: assert isinstance(i, SchematicObject)
+  for i in objects:
+    assert isinstance(i, SchematicObject)
+    # interpret drawings now, so that any error surfaces here
+    if isinstance(i, (Symbol, Pin)): i.drawing
   return objects
 
+class ObjectCache(object):
+  """ Keeps the interpreted objects of the last parse of a file, keyed by
+      their source bytes, so that parsing it again after an edit only
+      tokenizes and interprets the objects that changed. Objects are shared
+      between parses, and must not be modified. """
+  def __init__(self):
+    self.objects = {}
+
+  def parse_bdf(self, input):
+    """ Equivalent to parse_bdf(input). """
+    try:
+      # objects are found by their line (see split_lines), and each chunk
+      # is kept with the objects it holds (normally one)
+      start = find_bdf_start(input)
+      spans = lexer.split_lines(input, start)
+      parsed = lexer.parse_sexps(input[spans[0][0]:spans[0][1]])
+      validate_header(parsed)
+      objects, used = interpret_bdf(parsed), {}
+      for a, b in spans[1:]:
+        key = bytes(input[a:b])
+        chunk = used.get(key) or self.objects.get(key)
+        if chunk is None: chunk = interpret_bdf(lexer.parse_sexps(key))
+        used[key] = chunk
+        objects += chunk
+    except lexer.SexpError:
+      # let the full parser report the error (or handle the syntax)
+      self.objects = {}
+      return parse_bdf(input)
+    self.objects = used
+    return objects
+
+class LazySchematic(object):
+  """ Sequence of the objects in a schematic, that keeps their S-expressions
+      and interprets each object the first time it's accessed. Drawings of
+      symbols and pins are further deferred until accessed. """
+  def __init__(self, parsed):
+    self.parsed = parsed
+    self.objects = [None] * len(parsed)
+  def __len__(self):
+    return len(self.parsed)
+  def __getitem__(self, index):
+    object = self.objects[index]
+    if object is None:
+      object = self.objects[index] = parse_object(self.parsed[index])
+      assert isinstance(object, SchematicObject)
+    return object
+  def __iter__(self):
+    for i in range(len(self.parsed)):
+      yield self[i]
+  def filter(self, *types):
+    """ Iterate over the objects of the passed types (i.e. Pin, Connector),
+        without interpreting any other object. """
+    tags = {t.tag for t in types}
+    for i, object in enumerate(self.parsed):
+      if isinstance(object, list) and len(object) and object[0] in tags:
+        yield self[i]
+
 # Internal objects
 # (don't appear on the parsed result, will be replaced by its carrying attribute)
 
-class ParseObject(object): pass
+# All objects use __slots__ (big schematics have hundreds of thousands of
+# them); `tag` is the head token identifying them in the S-expression.
+# parse() gets the whole S-expression (head token included) and must not modify it.
+
+class ParseObject(object):
+  __slots__ = ()
+  def get_attributes(self):
+    """ Returns a dictionary with the attributes of the object. """
+    slots = [s for c in reversed(type(self).__mro__) for s in c.__dict__.get("__slots__", ())]
+    # private slots are exposed through a property
+    return {s.lstrip("_"): getattr(self, s.lstrip("_")) for s in slots}
 
 class FontSize(ParseObject):
-  name = u"font_size"
+  __slots__ = ("size",)
+  tag = u"font_size"
   def __init__(self, size):
     self.size = size
   @staticmethod
   def parse(object):
-    size = object.pop(0)
+    assert len(object) == 2
+    size = object[1]
     assert isinstance(size, int)
-    assert len(object) == 0
     return FontSize(size)
 
 class LineWidth(ParseObject):
-  name = u"line_width"
+  __slots__ = ("width",)
+  tag = u"line_width"
   def __init__(self, width):
     self.width = width
   @staticmethod
   def parse(object):
-    width = object.pop(0)
+    assert len(object) == 2
+    width = object[1]
     assert isinstance(width, int)
-    assert len(object) == 0
     return LineWidth(width)
 
 class Drawing(ParseObject):
-  name = u"drawing"
-  def __init__(self, objects):
-    self.objects = objects
+  """ Keeps the S-expression, contents are only interpreted when needed. """
+  __slots__ = ("raw",)
+  tag = u"drawing"
+  def __init__(self, raw):
+    self.raw = raw
+  @property
+  def objects(self):
+    try:
+      objects = list(map(parse_object, islice(self.raw, 1, None)))
+      for o in objects: assert isinstance(o, GraphicObject)
+    except ParseError:
+      raise
+    except Exception as e:
+      raise ObjectParseError(self.tag, self.raw, e)
+    return objects
   @staticmethod
   def parse(object):
-    objects = list(map(parse_object, object))
-    for o in objects: assert isinstance(o, GraphicObject)
-    return Drawing(objects)
+    return Drawing(object)
+
+def deferred_drawing():
+  """ Property for the drawing of a symbol or pin, that can be assigned a
+      Drawing to have it interpreted the first time it's accessed. """
+  def get(self):
+    drawing = self._drawing
+    if isinstance(drawing, Drawing):
+      drawing = self._drawing = drawing.objects
+    return drawing
+  def set(self, drawing):
+    self._drawing = drawing
+  return property(get, set)
 
 class AnnotationBlock(ParseObject):
-  name = u"annotation_block"
+  __slots__ = ()
+  tag = u"annotation_block"
   @staticmethod
   def parse(object):
     return AnnotationBlock() # TODO: parse those, use in Pin
@@ -119,7 +255,8 @@ class AnnotationBlock(ParseObject):
 # Basic objects
 
 class Font(ParseObject):
-  name = u"font"
+  __slots__ = ("font", "font_size", "bold")
+  tag = u"font"
   def __init__(self, font, font_size, bold):
     self.font = font
     self.font_size = font_size
@@ -133,11 +270,11 @@ class Font(ParseObject):
     return result
   @staticmethod
   def parse(object):
-    font = object.pop(0)
+    font = object[1]
     assert isinstance(font, str)
     font_size = None
     bold = None
-    for o in object:
+    for o in islice(object, 2, None):
       o = parse_object(o)
       if o == u"bold":
         assert bold is None
@@ -149,7 +286,8 @@ class Font(ParseObject):
     return Font(font, font_size, bold)
 
 class Bounds(ParseObject):
-  name = u"rect"
+  __slots__ = ("x1", "y1", "x2", "y2")
+  tag = u"rect"
   def __init__(self, x1, y1, x2, y2):
     self.x1, self.y1 = x1, y1
     self.x2, self.y2 = x2, y2
@@ -157,21 +295,29 @@ class Bounds(ParseObject):
     return u"Bounds{(%d, %d) to (%d, %d)}" % (self.x1, self.y1, self.x2, self.y2)
   @staticmethod
   def parse(object):
-    assert len(object) == 4
-    for i in object: assert isinstance(i, int)
-    return Bounds(*object)
-
-class Point(ParseObject):
-  name = u"pt"
-  def __init__(self, x, y):
-    self.x, self.y = x, y
+    assert len(object) == 5
+    x1, y1, x2, y2 = object[1], object[2], object[3], object[4]
+    assert isinstance(x1, int) and isinstance(y1, int) and isinstance(x2, int) and isinstance(y2, int)
+    return Bounds(x1, y1, x2, y2)
+
+class Point(ParseObject, tuple):
+  """ Immutable, and usable directly as a (x, y) coordinate tuple. """
+  __slots__ = ()
+  tag = u"pt"
+  def __new__(cls, x, y):
+    return tuple.__new__(cls, (x, y))
+  def __getnewargs__(self):
+    return tuple(self)
+  x = property(operator.itemgetter(0))
+  y = property(operator.itemgetter(1))
   def __repr__(self):
     return u"(%d, %d)" % (self.x, self.y)
   @staticmethod
   def parse(object):
-    assert len(object) == 2
-    for i in object: assert isinstance(i, int)
-    return Point(*object)
+    assert len(object) == 3
+    x, y = object[1], object[2]
+    assert isinstance(x, int) and isinstance(y, int)
+    return Point(x, y)
 
 # Attribute containers
 # (only found as attributes of one specific block)
@@ -179,7 +325,8 @@ class Point(ParseObject):
 DIRECTIONS = [u"output", u"input", u"bidir"] # FIXME: verify bidir
 
 class Port(ParseObject):
-  name = u"port"
+  __slots__ = ("p", "direction", "text1", "text2", "line")
+  tag = u"port"
   def __init__(self, p, direction, text1, text2, line):
     self.p = p
     self.direction = direction
@@ -190,8 +337,8 @@ class Port(ParseObject):
     return u"%s port %s at %s" % (self.direction, self.text1.text, self.point)
   @staticmethod
   def parse(object):
-    assert len(object) == 5
-    object = list(map(parse_object, object))
+    assert len(object) == 6
+    object = list(map(parse_object, islice(object, 1, None)))
     assert isinstance(object[0], Point)
     assert object[1] in DIRECTIONS
     assert isinstance(object[2], Text) and isinstance(object[3], Text)
@@ -202,22 +349,26 @@ class Port(ParseObject):
 # (anything that can appear on the top level)
 
 class SchematicObject(ParseObject):
+  __slots__ = ()
   def __repr__(self):
-    return "\n" + type(self).__name__ +" {\n  %s\n}" % pprint.pformat(vars(self), indent=2)[2:-1]
+    import pprint
+    return "\n" + type(self).__name__ +" {\n  %s\n}" % pprint.pformat(self.get_attributes(), indent=2)[2:-1]
 
 class Junction(SchematicObject):
-  name = u"junction"
+  __slots__ = ("p",)
+  tag = u"junction"
   def __init__(self, p):
     self.p = p
   @staticmethod
   def parse(object):
-    assert len(object) == 1
-    object = list(map(parse_object, object))
-    assert isinstance(object[0], Point)
-    return Junction(*object)
+    assert len(object) == 2
+    p = parse_object(object[1])
+    assert isinstance(p, Point)
+    return Junction(p)
 
 class Connector(SchematicObject):
-  name = u"connector"
+  __slots__ = ("p1", "p2", "label", "bus")
+  tag = u"connector"
   def __init__(self, p1, p2, label, bus): # FIXME: conduit lines
     self.p1, self.p2 = p1, p2
     self.label = label
@@ -236,7 +387,8 @@ class Connector(SchematicObject):
     return Connector(object[Point][0], object[Point][1], label, bus)
 
 class Symbol(SchematicObject):
-  name = u"symbol"
+  __slots__ = ("bounds", "ports", "typeText", "name", "_drawing", "mirror", "rotation")
+  tag = u"symbol"
   def __init__(self, bounds, ports, typeText, name, drawing, mirror, rotation):
     self.bounds = bounds
     self.ports = ports
@@ -245,6 +397,7 @@ class Symbol(SchematicObject):
     self.drawing = drawing
     self.mirror = mirror
     self.rotation = rotation
+  drawing = deferred_drawing()
   @staticmethod
   def parse(object):
     o = parse_grouped(object, {
@@ -261,10 +414,11 @@ class Symbol(SchematicObject):
         mirror = sflag.group(2)
         if len(sflag.groups()) > 2 and sflag.group(3): rotation = int(sflag.group(3))
       else: raise ParseError(u"Unknown flag %s in Symbol" % flag)
-    return Symbol(o[Bounds][0], o[Port], o[Text][0], o[Text][1], o[Drawing][0].objects, mirror, rotation)
+    return Symbol(o[Bounds][0], o[Port], o[Text][0], o[Text][1], o[Drawing][0], mirror, rotation)
 
 class Pin(SchematicObject):
-  name = u"pin"
+  __slots__ = ("bounds", "direction", "p", "typeText", "name", "level", "_drawing", "mirror", "rotation")
+  tag = u"pin"
   def __init__(self, bounds, direction, p, typeText, name, level, drawing, mirror, rotation):
     self.bounds = bounds
     self.direction = direction
@@ -275,6 +429,7 @@ class Pin(SchematicObject):
     self.drawing = drawing
     self.mirror = mirror
     self.rotation = rotation
+  drawing = deferred_drawing()
   @staticmethod
   def parse(object):
     o = parse_grouped(object, {
@@ -296,13 +451,14 @@ class Pin(SchematicObject):
         assert direction is None
         direction = flag
       else: raise ParseError(u"Unknown flag %s in Pin" % flag)
-    return Pin(o[Bounds][0], direction, o[Point][0], o[Text][0], o[Text][1], level, o[Drawing][0].objects, mirror, rotation)
+    return Pin(o[Bounds][0], direction, o[Point][0], o[Text][0], o[Text][1], level, o[Drawing][0], mirror, rotation)
 
 class GraphicObject(SchematicObject):
-  pass
+  __slots__ = ()
 
 class Text(GraphicObject):
-  name = u"text"
+  __slots__ = ("text", "bounds", "font", "vertical", "invisible")
+  tag = u"text"
   def __init__(self, text, bounds, font, vertical, invisible):
     self.text = text
     self.bounds = bounds
@@ -311,13 +467,13 @@ class Text(GraphicObject):
     self.invisible = invisible
   @staticmethod
   def parse(object):
-    text = object.pop(0)
+    text = object[1]
     assert isinstance(text, str)
     o = parse_grouped(object, {
       Bounds: (1,1),
       Font: (1,1),
       str: (0,),
-    })
+    }, 2)
     vertical, invisible = None, None
     for flag in o[str]:
       if flag == u"vertical":
@@ -330,14 +486,15 @@ class Text(GraphicObject):
     return Text(text, o[Bounds][0], o[Font][0], vertical, invisible)
 
 class Line(GraphicObject):
-  name = u"line"
+  __slots__ = ("p1", "p2", "line_width")
+  tag = u"line"
   def __init__(self, p1, p2, line_width):
     self.p1, self.p2 = p1, p2
     self.line_width = line_width
   @staticmethod
   def parse(object): # FIXME: migrate
-    assert len(object) == 3
-    object = list(map(parse_object, object))
+    assert len(object) == 4
+    object = list(map(parse_object, islice(object, 1, None)))
     assert isinstance(object[0], Point)
     assert isinstance(object[1], Point)
     assert isinstance(object[2], LineWidth)
@@ -345,7 +502,8 @@ class Line(GraphicObject):
     return Line(*object)
 
 class Arc(GraphicObject):
-  name = u"arc"
+  __slots__ = ("p1", "p2", "bounds", "line_width")
+  tag = u"arc"
   def __init__(self, p1, p2, bounds, line_width):
     self.p1, self.p2 = p1, p2
     self.bounds = bounds
@@ -362,7 +520,8 @@ class Arc(GraphicObject):
     return Arc(o[Point][0], o[Point][1], o[Bounds][0], line_width)
 
 class Rectangle(GraphicObject):
-  name = u"rectangle"
+  __slots__ = ("bounds", "line_width")
+  tag = u"rectangle"
   def __init__(self, bounds, line_width):
     self.bounds = bounds
     self.line_width = line_width
@@ -377,7 +536,8 @@ class Rectangle(GraphicObject):
     return Rectangle(o[Bounds][0], line_width)
 
 class Circle(GraphicObject):
-  name = u"circle"
+  __slots__ = ("bounds", "line_width")
+  tag = u"circle"
   def __init__(self, bounds, line_width):
     self.bounds = bounds
     self.line_width = line_width
@@ -398,30 +558,33 @@ all_types = {}
 def parse_object(object):
   if (not isinstance(object, list)) or len(object) < 1 or (not isinstance(object[0], str)):
     raise ParseError(u"Not an object: %s" % repr(object))
-  name = object.pop(0)
-  if name not in all_types:
-    if len(object) == 0: return name
+  name = object[0]
+  object_type = all_types.get(name)
+  if object_type is None:
+    if len(object) == 1: return name
     raise ParseError(u"Unknown object type %s" % name)
   try:
-    result = all_types[name].parse(object)
-    assert isinstance(result, all_types[name])
+    result = object_type.parse(object)
+    assert isinstance(result, object_type)
     return result
+  except ParseError:
+    raise
   except Exception as e:
-    if isinstance(e, ParseError): raise
-    raise ParseError(u"Couldn't parse %s %s:\n%s" % (name, repr(object), traceback.format_exc(e)))
+    raise ObjectParseError(name, object, e)
 
-def parse_grouped(object, types):
-  """ types is a dictionary mapping Type -> (min occurrences, max occurrences) """
+def parse_grouped(object, types, start=1):
+  """ types is a dictionary mapping Type -> (min occurrences, max occurrences)
+      children of object (starting at index start) are routed by their head token,
+      those not corresponding to a type (flags) go to the str group """
   result = {t: [] for t in types}
-  for o in map(parse_object, object):
-    added = False
-    for t in result:
-      if isinstance(o, t):
-        result[t].append(o)
-        added = True
-        break
-    if not added:
-      raise ParseError(u"Unexpected %s object in %s" % (type(o), o))
+  for i in range(start, len(object)):
+    child = object[i]
+    t = None
+    if isinstance(child, list) and len(child): t = all_types.get(child[0])
+    group = result.get(t or str)
+    if group is None:
+      raise ParseError(u"Unexpected %s object in %s" % (t or str, child))
+    group.append(parse_object(child))
   for t in result:
     l, constraints = len(result[t]), types[t]
     min, max = constraints[0], None
@@ -434,5 +597,5 @@ def parse_grouped(object, types):
 
 # Make them inherit from base class to tag them, don't rely in name present
 for thing in list(globals().values()):
-  if (type(thing) is type) and issubclass(thing, ParseObject) and hasattr(thing, "name"):
-    all_types[thing.name] = thing
+  if (type(thing) is type) and issubclass(thing, ParseObject) and hasattr(thing, "tag"):
+    all_types[thing.tag] = thing
@@ -15,8 +15,13 @@
 # You should have received a copy of the GNU General Public License
 # along with bdf2tikz.  If not, see <http://www.gnu.org/licenses/>.
 
-from . import parser, render
-from .parser import parse_bdf
+import os
+import mmap
+import stat
+import tempfile
+import contextlib
+from . import parser, render, spatial
+from .profile import NULL_PROFILE
 
 default_options = {
   "scale": 1/42.,
@@ -26,34 +31,223 @@ default_options = {
   "render_symbol_bounds": True, "render_primitive_bounds": False,
   "port_input_arrows": True, "port_arrows_if_invisible": False,
   "connector_output_arrows": True,
+  "symbol_templates": False, "split_t_junctions": False,
+  "simplify_runs": False, "orthogonal_runs": False,
 
   "offset": (0,0), "extra_args": [],
 }
 
-def render_bdf(rs, options):
-  rs = parse_bdf(rs)
-  lines = []
-  output = ""
-  complementary_output = ""
-
-  for thing in rs:
-    if isinstance(thing, parser.Pin):
-      output += render.render_tikz_comment("Pin (%s) named %s" % (thing.typeText.text, thing.name.text), options)
-      output += render.render_pin(lines, thing, options) + "\n"
-    elif isinstance(thing, parser.Symbol):
-      output += render.render_tikz_comment("Symbol (%s) named %s" % (thing.typeText.text, thing.name.text), options)
-      output += render.render_symbol(lines, thing, options) + "\n"
-    elif isinstance(thing, parser.Text):
-      output += render.render_text(thing, options) + "\n"
-    elif isinstance(thing, parser.Junction):
-      complementary_output += render.render_junction(thing, options)
-    elif isinstance(thing, parser.Connector):
-      tmp = render.render_connector(lines, thing, options)
-      if tmp: complementary_output += tmp
-    else:
-      print("WARNING: couldn't process object of type %s in schematic" % (type(thing),))
-
-  output += render.render_all_lines(lines, options)
-  output += complementary_output
+@contextlib.contextmanager
+def map_input(path):
+  """ Map the file at path in memory, yielding a read-only buffer that can
+      be passed as the contents to render_bdf, so that large inputs aren't
+      copied. Files that can't be mapped (pipes, FIFOs, empty files...)
+      are read instead. """
+  with open(path, "rb") as f:
+    buffer = None
+    if stat.S_ISREG(os.fstat(f.fileno()).st_mode):
+      try:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+      except (OSError, ValueError):
+        pass
+    if buffer is None:
+      yield f.read()
+      return
+    with buffer:
+      yield buffer
+
+def get_umask():
+  umask = os.umask(0)
+  os.umask(umask)
+  return umask
+
+@contextlib.contextmanager
+def atomic_output(path):
+  """ Yields a text stream to write the contents of path to. They're written
+      to a temporary file next to it, which replaces path only if the block
+      succeeds (it's removed otherwise), so a previous output is left intact
+      on errors, and readers never see a partial file. """
+  directory = os.path.dirname(path)
+  fd, temp = tempfile.mkstemp(dir=directory or ".", prefix=".", suffix=".tmp")
+  try:
+    # mkstemp creates files only readable by the owner
+    try:
+      mode = stat.S_IMODE(os.stat(path).st_mode)
+    except OSError:
+      mode = 0o666 & ~get_umask()
+    os.chmod(temp, mode)
+    with os.fdopen(fd, "w") as stream:
+      yield stream
+    os.replace(temp, path)
+  except BaseException:
+    if os.path.exists(temp): os.remove(temp)
+    raise
 
+def render_bdf(rs, options, cache=None, workers=1, profile=None, object_cache=None):
+  """ Render the passed BDF contents (bytes or a bytes-like object, see
+      map_input). If a RenderCache is passed,
+      output is looked up there first, and stored after rendering.
+      See iter_render_bdf for workers, profile and object_cache. """
+  if cache is None:
+    return "".join(iter_render_bdf(rs, options, workers, profile, object_cache))
+  key = cache.get_key(rs, options)
+  with (profile or NULL_PROFILE).stage("cache lookup"):
+    output = cache.get(key)
+  if output is None:
+    output = "".join(iter_render_bdf(rs, options, workers, profile, object_cache))
+    cache.put(key, output)
   return output
+
+def render_bdf_to(stream, rs, options, cache=None, workers=1, profile=None, object_cache=None):
+  """ Like render_bdf, but writes the output to a file-like object as it's produced. """
+  if cache is None:
+    for chunk in iter_render_bdf(rs, options, workers, profile, object_cache):
+      stream.write(chunk)
+    return
+  key = cache.get_key(rs, options)
+  with (profile or NULL_PROFILE).stage("cache lookup"):
+    output = cache.get(key)
+  if output is None:
+    chunks = []
+    for chunk in iter_render_bdf(rs, options, workers, profile, object_cache):
+      stream.write(chunk)
+      chunks.append(chunk)
+    output = "".join(chunks)
+    cache.put(key, output)
+  else:
+    stream.write(output)
+
+def iter_render_bdf(rs, options, workers=1, profile=None, object_cache=None):
+  """ Generator yielding the output of render_bdf in chunks, one per object or run.
+      Junctions and connector labels are drawn over the lines, so their (small)
+      chunks are held until the runs have been rendered.
+
+      If workers isn't 1, objects are interpreted and rendered by a pool of
+      that many processes (None means one per CPU), in contiguous shards.
+      Only the runs are built in this process, from the line segments of all
+      shards. Output is the same either way.
+
+      If a Profile is passed, the time spent in each stage is recorded there
+      (time spent by the consumer of the chunks isn't counted).
+
+      If a parser.ObjectCache is passed (and workers is 1), objects that
+      didn't change since it was last used aren't parsed again. """
+  profile = profile or NULL_PROFILE
+  context = render.RenderContext(options)
+  if object_cache is not None and workers == 1:
+    with profile.stage("parse (object cache)"):
+      objects = object_cache.parse_bdf(rs)
+  else:
+    with profile.stage("find_bdf_start"):
+      start = parser.find_bdf_start(rs)
+    with profile.stage("parse_sexps"):
+      parsed = parser.parse_sexps(rs, False, start)
+      parser.validate_header(parsed)
+
+  if workers == 1:
+    if object_cache is None:
+      with profile.stage("interpret_bdf"):
+        objects = parser.interpret_bdf(parsed)
+    lines = []
+    complementary_output = []
+    templates = None
+    if options.get("symbol_templates"):
+      with profile.stage("symbol_templates"):
+        templates = render.SymbolTemplates([thing for thing in objects if isinstance(thing, parser.Symbol)])
+    for chunk in iter_render_objects(objects, context, lines, complementary_output, templates, profile):
+      yield chunk
+  else:
+    lines, complementary_output = [], []
+    shards = profile.stage("render objects (parallel)").iterate(render_objects_parallel(parsed, options, workers))
+    for chunks, shard_lines, shard_output in shards:
+      for chunk in chunks:
+        yield chunk
+      lines += shard_lines
+      complementary_output += shard_output
+
+  if options.get("split_t_junctions"):
+    with profile.stage("split_t_junctions"):
+      lines = spatial.split_t_junctions(lines)
+  with profile.stage("trace_line_runs"):
+    runs = render.trace_line_runs(lines)
+  render_line_run = profile.stage("render_line_run")
+  for run in runs:
+    with render_line_run:
+      chunk = render.render_line_run(run, context)
+    yield chunk
+  for chunk in complementary_output:
+    yield chunk
+
+def iter_render_objects(objects, options, lines, complementary_output, templates=None, profile=NULL_PROFILE):
+  """ Yields the output of each object, except for junctions and connector
+      labels which are appended to complementary_output. Line segments to
+      be traced into runs are appended to lines. """
+  stages = {}
+  for thing in objects:
+    stage = stages.get(type(thing))
+    if stage is None:
+      stage = stages[type(thing)] = profile.stage("render %s" % type(thing).__name__)
+    with stage:
+      if isinstance(thing, parser.Pin):
+        chunk = render.render_tikz_comment("Pin (%s) named %s" % (thing.typeText.text, thing.name.text), options)
+        chunk += render.render_pin(lines, thing, options) + "\n"
+      elif isinstance(thing, parser.Symbol):
+        chunk = render.render_tikz_comment("Symbol (%s) named %s" % (thing.typeText.text, thing.name.text), options)
+        chunk += render.render_symbol(lines, thing, options, templates) + "\n"
+      elif isinstance(thing, parser.Text):
+        chunk = render.render_text(thing, options) + "\n"
+      else:
+        chunk = None
+        if isinstance(thing, parser.Junction):
+          complementary_output.append(render.render_junction(thing, options))
+        elif isinstance(thing, parser.Connector):
+          tmp = render.render_connector(lines, thing, options)
+          if tmp: complementary_output.append(tmp)
+        else:
+          print("WARNING: couldn't process object of type %s in schematic" % (type(thing),))
+    if chunk is not None:
+      yield chunk
+
+# PARALLEL RENDERING
+
+class ResolvedTemplates(object):
+  """ Stand-in for SymbolTemplates in a worker: the parent resolves the
+      lookups of every symbol in the sheet (in order, so that each pic is
+      defined by its first symbol), and each worker gets those of its shard. """
+  def __init__(self, lookups):
+    self.lookups = iter(lookups)
+  def lookup(self, symbol):
+    return next(self.lookups)
+
+def render_objects_shard(parsed, options, lookups=None):
+  """ Worker: interpret and render a shard of S-expressions, returning
+      (output chunks, line segments, complementary chunks). """
+  lines = []
+  complementary_output = []
+  templates = None if lookups is None else ResolvedTemplates(lookups)
+  objects = parser.interpret_bdf(parsed)
+  chunks = list(iter_render_objects(objects, render.RenderContext(options), lines, complementary_output, templates))
+  return chunks, lines, complementary_output
+
+def render_objects_parallel(parsed, options, workers=None, shards_per_worker=4):
+  """ Render the S-expressions of a sheet using a process pool, yielding
+      the result of render_objects_shard for each shard, in order. """
+  from concurrent.futures import ProcessPoolExecutor
+  workers = workers or os.cpu_count() or 1
+  count = workers * shards_per_worker
+  size = max(1, -(-len(parsed) // count))
+  shards = [parsed[i:i+size] for i in range(0, len(parsed), size)]
+
+  # symbol templates depend on the whole sheet, resolve them here
+  lookups = [None] * len(shards)
+  if options.get("symbol_templates"):
+    schematic = parser.LazySchematic(parsed)
+    templates = render.SymbolTemplates(schematic.filter(parser.Symbol))
+    for n in range(len(shards)):
+      objects = (schematic[i] for i in range(n * size, min((n + 1) * size, len(parsed))))
+      lookups[n] = [templates.lookup(o) for o in objects if isinstance(o, parser.Symbol)]
+
+  with ProcessPoolExecutor(max_workers=workers) as executor:
+    futures = [executor.submit(render_objects_shard, shard, options, lookup) for shard, lookup in zip(shards, lookups)]
+    for future in futures:
+      yield future.result()
@@ -0,0 +1,98 @@
+# Copyright 2016 Alba Mendez <me@alba.sh>
+#
+# This file is part of bdf2tikz.
+#
+# bdf2tikz is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# bdf2tikz is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with bdf2tikz.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Per-stage timing of a render, to find out where the time of a slow
+sheet goes. Pass a Profile to render_bdf and read it afterwards:
+
+    profile = Profile()
+    render_bdf(rs, options, profile=profile)
+    print(profile.format())
+"""
+
+import time
+
+class Stage(object):
+  """ Accumulated wall time and number of calls of a stage. Used as a
+      context manager around each call (not reentrant). """
+  __slots__ = ("name", "time", "calls", "start")
+  def __init__(self, name):
+    self.name = name
+    self.time = 0.
+    self.calls = 0
+  def __enter__(self):
+    self.start = time.perf_counter()
+    return self
+  def __exit__(self, *exc):
+    self.time += time.perf_counter() - self.start
+    self.calls += 1
+
+  def iterate(self, iterable):
+    """ Wraps an iterator (i.e. a generator doing the actual work), timing
+        the production of each item as a call. """
+    iterator = iter(iterable)
+    while True:
+      start = time.perf_counter()
+      try:
+        item = next(iterator)
+      except StopIteration:
+        self.time += time.perf_counter() - start
+        return
+      self.time += time.perf_counter() - start
+      self.calls += 1
+      yield item
+
+class Profile(object):
+  def __init__(self):
+    self.stages = {}
+
+  def stage(self, name):
+    """ Returns the Stage called name, creating it (in order) if needed. """
+    stage = self.stages.get(name)
+    if stage is None:
+      stage = self.stages[name] = Stage(name)
+    return stage
+
+  def report(self):
+    """ Stages as a JSON-serializable list of {name, time, calls}, in the
+        order they were first entered. """
+    return [{"name": s.name, "time": s.time, "calls": s.calls} for s in self.stages.values()]
+
+  def format(self):
+    total = sum(s.time for s in self.stages.values()) or 1.
+    lines = [u"%-26s %10s %6s %10s" % (u"stage", u"time", u"", u"calls")]
+    for s in self.stages.values():
+      lines.append(u"%-26s %9.4fs %5.1f%% %10d" % (s.name, s.time, 100. * s.time / total, s.calls))
+    return u"\n".join(lines)
+
+class NullStage(object):
+  __slots__ = ()
+  def __enter__(self):
+    return self
+  def __exit__(self, *exc):
+    pass
+  def iterate(self, iterable):
+    return iterable
+
+NULL_STAGE = NullStage()
+
+class NullProfile(object):
+  """ Profile that records nothing, used when none is passed. """
+  def stage(self, name):
+    return NULL_STAGE
+
+NULL_PROFILE = NullProfile()
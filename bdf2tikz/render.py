@@ -15,10 +15,16 @@
 # You should have received a copy of the GNU General Public License
 # along with bdf2tikz.  If not, see <http://www.gnu.org/licenses/>.
 
+import sys
 import math
-import pyparsing
+import re
+import functools
+from itertools import chain
 from . import parser
 
+# pyparsing and numpy take long to import, so they're only imported when
+# first needed (a full node name grammar, or a long batch of points).
+
 class RenderError(Exception):
   pass
 
@@ -29,13 +35,76 @@ class RenderError(Exception):
 #     extra_args: list of strings, extra TikZ options to use in statements
 #     anchor_ports: whether port names should be anchored optimally
 #     anchor_labels: whether connector labels should be anchored optimally
+#     symbol_templates: whether repeated symbol bodies should be defined once, as pics
+#     simplify_runs: whether repeated points and points in the middle of a straight
+#       stretch should be removed from runs
+#     orthogonal_runs: whether runs should use the |- and -| TikZ operators for corners
+#     split_t_junctions: whether connectors should be split where other lines end on
+#       them, so that T connections become part of the same run (see spatial.py)
 #     FIXME: document others
+#
+# Internally, the dictionary is wrapped in a RenderContext (see below).
+# Every function accepts either of them.
+
+class RenderContext(object):
+  """ Options prepared for rendering: the fields changed while rendering
+      (offset, extra_args, text_anchor, text_transform) are attributes, and
+      derive() returns a child context without copying the options.
+      It can still be used as a dictionary of options. """
+  __slots__ = ("options", "scale", "offset", "extra_args", "text_anchor", "text_transform")
+  FIELDS = {"scale", "offset", "extra_args", "text_anchor", "text_transform"}
+  OPTIONAL_FIELDS = {"text_anchor", "text_transform"}
+
+  def __init__(self, options):
+    self.options = options
+    self.scale = options["scale"]
+    self.offset = options["offset"]
+    self.extra_args = options["extra_args"]
+    self.text_anchor = options.get("text_anchor")
+    self.text_transform = options.get("text_transform")
+
+  def derive(self, offset=None, extra_args=None, text_anchor=None, text_transform=None):
+    """ Returns a child context, with the passed fields replaced. """
+    child = RenderContext.__new__(RenderContext)
+    child.options = self.options
+    child.scale = self.scale
+    child.offset = self.offset if offset is None else offset
+    child.extra_args = self.extra_args if extra_args is None else extra_args
+    child.text_anchor = self.text_anchor if text_anchor is None else text_anchor
+    child.text_transform = self.text_transform if text_transform is None else text_transform
+    return child
+
+  # dictionary API
+
+  def __getitem__(self, key):
+    if key in RenderContext.FIELDS:
+      value = getattr(self, key)
+      if value is None and key in RenderContext.OPTIONAL_FIELDS: raise KeyError(key)
+      return value
+    return self.options[key]
+
+  def __setitem__(self, key, value):
+    if key not in RenderContext.FIELDS:
+      raise KeyError("option %s can't be changed while rendering" % key)
+    setattr(self, key, value)
+
+  def __contains__(self, key):
+    if key in RenderContext.OPTIONAL_FIELDS: return getattr(self, key) is not None
+    return key in RenderContext.FIELDS or key in self.options
+
+  def get(self, key, default=None):
+    return self[key] if key in self else default
+
+def get_context(options):
+  """ Returns options as a RenderContext (if it's not already one). """
+  if type(options) is RenderContext: return options
+  return RenderContext(options)
 
 # VERY LOW LEVEL
 # TikZ syntax for coordinates, points...
 
 def render_tikz_length(length, options):
-  return u"%.4f" % (length * options["scale"])
+  return u"%.4f" % (length * get_context(options).scale)
 
 def render_tikz_vector(vector, options):
   assert len(vector) == 2
@@ -43,16 +112,75 @@ def render_tikz_vector(vector, options):
   return u"(%s,%s)" % tuple(map(lambda x: render_tikz_length(x, options), vector))
 
 def render_tikz_point(point, options):
-  vector = point[0] + options["offset"][0], point[1] + options["offset"][1]
-  return render_tikz_vector(vector, options)
+  # same as render_tikz_vector(point + offset), inlined
+  options = get_context(options)
+  scale, offset = options.scale, options.offset
+  return u"(%.4f,%.4f)" % ((point[0] + offset[0]) * scale, -(point[1] + offset[1]) * scale)
+
+# Batches of points (runs, drawings) are transformed and formatted at once,
+# with NumPy if available. Results are identical to the scalar path above.
+
+NUMPY_MIN_POINTS = 16
+
+_numpy = False
+
+def get_numpy():
+  """ Returns the numpy module (imported on first call), or None if not available. """
+  global _numpy
+  if _numpy is False:
+    try:
+      import numpy as _numpy
+    except ImportError:
+      _numpy = None
+  return _numpy
+
+def render_tikz_points(points, options, transform=None):
+  """ Equivalent to [render_tikz_point(get_point_transform(transform)(p), options) for p in points],
+      transform being an optional object with bounds, mirror and rotation. """
+  options = get_context(options)
+  scale = options.scale
+  ox, oy = options.offset
+  numpy = get_numpy() if len(points) >= NUMPY_MIN_POINTS else None
+  if numpy is None:
+    if transform is not None: points = list(map(get_point_transform(transform), points))
+    return [u"(%.4f,%.4f)" % ((x + ox) * scale, -(y + oy) * scale) for x, y in points]
+
+  array = numpy.fromiter(chain.from_iterable(points), float, 2 * len(points))
+  x, y = array[0::2], array[1::2]
+  if transform is not None:
+    bounds = transform.bounds
+    if transform.mirror == "x": y = (bounds.y2 - bounds.y1) - y
+    if transform.mirror == "y": x = (bounds.x2 - bounds.x1) - x
+    matrix = ROTATION_MATRIXES[transform.rotation or 0]
+    x, y = matrix[0][0] * x + matrix[0][1] * y, matrix[1][0] * x + matrix[1][1] * y
+  x = (x + ox) * scale
+  y = -(y + oy) * scale
+  # interleave coordinates back, and format them all with a single operation
+  array[0::2], array[1::2] = x, y
+  result = ((u"(%.4f,%.4f)\0" * len(points)) % tuple(array.tolist())).split(u"\0")
+  result.pop()
+
+  # the sign of a zero depends on whether the coordinates were ints or
+  # floats in the scalar path, so let it format those points
+  for i in numpy.flatnonzero((x == 0) | (y == 0)).tolist():
+    point = points[i]
+    if transform is not None: point = get_point_transform(transform)(point)
+    result[i] = render_tikz_point(point, options)
+  return result
 
 def render_tikz_statement(arguments, content, options):
-  arguments = options["extra_args"] + arguments
+  arguments = get_context(options).extra_args + arguments
   return u"  \\draw[%s] %s;\n" % (u", ".join(arguments), content)
 
 def render_tikz_comment(comment, options):
   return u"  %% %s\n" % (comment,)
 
+def render_tikz_pic_definition(name, content, options):
+  return u"  \\tikzset{%s/.pic={\n%s  }}\n" % (name, content)
+
+def render_tikz_pic(name, point, options):
+  return u"  \\pic at %s {%s};\n" % (render_tikz_point(point, options), name)
+
 REGULAR_ESCAPES = u"&%$#_{}"
 SPECIAL_ESCAPES = {u"\\": u"textbackslash", u"^": u"textasciicircum", u"~": u"textasciitilde"}
 def escape_latex_char(c):
@@ -103,31 +231,70 @@ def calculate_anchor_point(bounds, vertical, anchor):
   if vertical: x, y = 1-y, x
   return (map(x, bounds.x1, bounds.x2), map(y, bounds.y2, bounds.y1))
 
+# For calculate_optimal_anchor_to_line: for each anchor (in TEXT_ANCHORS
+# order, which breaks ties), the indexes of its point in the horizontal and
+# vertical fractions of the bounds (see calculate_anchor_point) and its
+# penalty, for horizontal and vertical text.
+ANCHOR_FRACTIONS = (0, .5, 1)
+
+def build_anchor_table(vertical):
+  table = []
+  for anchor, (x, y) in TEXT_ANCHORS.items():
+    x, y = TEXT_HPOINTS[x], TEXT_VPOINTS[y]
+    if vertical: x, y = 1-y, x
+    penalty = abs(TEXT_ANCHORS[anchor][0]) + abs(TEXT_ANCHORS[anchor][1])
+    table.append((anchor, ANCHOR_FRACTIONS.index(x), ANCHOR_FRACTIONS.index(y), penalty))
+  return table
+
+ANCHOR_TABLES = {vertical: build_anchor_table(vertical) for vertical in (False, True)}
+
 def calculate_optimal_anchor_to_line(bounds, vertical, line):
-  def distance_to_segment(a, b, x):
-    # vector algebra on the go! :D
-    subtract = lambda a, b: (a[0]-b[0], a[1]-b[1])
-    dot = lambda a, b: a[0]*b[0] + a[1]*b[1]
-    norm = lambda a: math.sqrt(dot(a, a))
-    distance = lambda a, b: norm(subtract(a, b))
-    map = lambda x, start, end: start + x * (end - start)
-
-    l = distance(a, b)
-    if l == 0: return distance(a, x)
-    t = max(0, min(1, dot(subtract(x,a), subtract(b,a)) / l))
-    projection = (map(t, a[0], b[0]), map(t, a[1], b[1]))
-    return distance(x, projection)
-
-  p1 = (line.p1.x, line.p1.y)
-  p2 = (line.p2.x, line.p2.y)
-  anchors = TEXT_ANCHORS.keys()
-  anchors = sorted(anchors, key=lambda anchor: distance_to_segment(p1, p2, calculate_anchor_point(bounds, vertical, anchor)) + 1*(abs(TEXT_ANCHORS[anchor][0]) + abs(TEXT_ANCHORS[anchor][1])))
-  return anchors[0]
+  """ Anchor of the text whose point is closest to the line, penalizing
+      anchors away from the center by 1 unit per direction. """
+  return calculate_optimal_anchors_to_lines([(bounds, vertical, line)])[0]
+
+def calculate_optimal_anchors_to_lines(labels):
+  """ calculate_optimal_anchor_to_line for each (bounds, vertical, line)
+      in labels, i.e. all the port names of a symbol. """
+  sqrt = math.sqrt
+  result = []
+  for bounds, vertical, line in labels:
+    p1, p2 = line.p1, line.p2
+    a0, a1 = p1[0], p1[1]
+    d0, d1 = p2[0]-a0, p2[1]-a1
+    l = sqrt(d0*d0 + d1*d1)
+    # the points at each fraction of the bounds (see ANCHOR_FRACTIONS)
+    w, h = bounds.x2-bounds.x1, bounds.y1-bounds.y2
+    x0, xc, x1 = bounds.x1, bounds.x1 + .5*w, bounds.x1 + 1*w
+    y0, yc, y1 = bounds.y2, bounds.y2 + .5*h, bounds.y2 + 1*h
+    best, best_score = None, None
+    for anchor, i, j, penalty in ANCHOR_TABLES[bool(vertical)]:
+      # score can't be lower than the penalty, so some anchors are skipped
+      # without calculating their distance
+      if best_score is not None and penalty >= best_score: continue
+      x = xc if i == 1 else (x0 if i == 0 else x1)
+      y = yc if j == 1 else (y0 if j == 0 else y1)
+      if l == 0:
+        e0, e1 = a0-x, a1-y
+      else:
+        # t is the projection divided by the length (not its square), so the
+        # point is projected on the first unit of the segment; it's kept that
+        # way so that anchors don't change
+        t = ((x-a0)*d0 + (y-a1)*d1) / l
+        if not t < 1: t = 1
+        if not t > 0: t = 0
+        e0, e1 = x-(a0 + t*d0), y-(a1 + t*d1)
+      score = sqrt(e0*e0 + e1*e1) + penalty
+      if best_score is None or score < best_score:
+        best, best_score = anchor, score
+    result.append(best)
+  return result
 
 def render_text(object, options):
-  anchor = options["text_anchor"] if "text_anchor" in options else "center"
+  options = get_context(options)
+  anchor = options.text_anchor or "center"
   bold = object.font.bold
-  text_transform = options["text_transform"] if "text_transform" in options else lambda x: render_tikz_text(x, options)
+  text_transform = options.text_transform or (lambda x: render_tikz_text(x, options))
   text = text_transform(object.text)
   vertical = object.vertical
   point = calculate_anchor_point(object.bounds, vertical, anchor)
@@ -143,13 +310,14 @@ def render_text(object, options):
 # Renders one TikZ statement for a passed graphic shape
 
 def render_graphic_object(object, options):
+  options = get_context(options)
 
   if isinstance(object, parser.Text):
     return render_text(object)
 
   if isinstance(object, parser.Line):
     p1, p2 = object.p1, object.p2
-    contents = "%s -- %s" % (render_tikz_point((p1.x, p1.y), options), render_tikz_point((p2.x, p2.y), options))
+    contents = "%s -- %s" % (render_tikz_point(p1, options), render_tikz_point(p2, options))
     arguments = []
     return render_tikz_statement(arguments, contents, options)
 
@@ -158,8 +326,7 @@ def render_graphic_object(object, options):
     center = ((bounds.x1+bounds.x2) / 2.0, (bounds.y1+bounds.y2) / 2.0)
     radius = (abs(bounds.x1-bounds.x2) / 2.0, abs(bounds.y1-bounds.y2) / 2.0)
 
-    p1 = (object.p1.x, object.p1.y)
-    p2 = (object.p2.x, object.p2.y)
+    p1, p2 = object.p1, object.p2
     dp1 = ((p1[0]-center[0])/radius[0], -(p1[1]-center[1])/radius[1])
     dp2 = ((p2[0]-center[0])/radius[0], -(p2[1]-center[1])/radius[1])
 
@@ -200,6 +367,19 @@ def render_graphic_object(object, options):
     arguments = []
     return render_tikz_statement(arguments, contents, options)
 
+def render_graphic_objects(objects, options):
+  """ Renders a list of graphic objects, formatting the points of all lines at once. """
+  options = get_context(options)
+  lines = [o for o in objects if isinstance(o, parser.Line)]
+  points = iter(render_tikz_points([p for o in lines for p in (o.p1, o.p2)], options))
+  statements = []
+  for o in objects:
+    if isinstance(o, parser.Line):
+      statements.append(render_tikz_statement([], "%s -- %s" % (next(points), next(points)), options))
+    else:
+      statements.append(render_graphic_object(o, options))
+  return statements
+
 # TRANSFORMS
 # Interpret transform attributes in objects into TikZ arguments,
 # or equivalent matrixes.
@@ -267,17 +447,67 @@ def _prepare_node_name_parser():
     .setParseAction(lambda x: (x[0][0], x[0][1] if len(x[0]) > 1 else None))
   return OneOrMore(component)
 
-node_name_parser = _prepare_node_name_parser()
+_node_name_parser = None
+
+def get_node_name_parser():
+  """ Returns the pyparsing grammar for node names, built on first call. """
+  global _node_name_parser
+  if _node_name_parser is None:
+    _node_name_parser = _prepare_node_name_parser()
+  return _node_name_parser
+
+def node_name_errors():
+  """ Exceptions raised on invalid node names, for use in except clauses.
+      They can only be raised once pyparsing has been imported. """
+  pyparsing = sys.modules.get("pyparsing")
+  return pyparsing.ParseException if pyparsing else ()
+
+def __getattr__(name):
+  # node_name_parser and numpy used to be set at import time
+  if name == "node_name_parser": return get_node_name_parser()
+  if name == "numpy": return get_numpy()
+  raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
+# Parsed names and widths are memoized in bounded LRU caches, shared by
+# every schematic rendered in the process (the same names repeat a lot).
+
+NODE_NAME_CACHE_SIZE = 8192
+
+# fast path for the common `name`, `name[n]` and `name[hi..lo]` forms
+SIMPLE_NODE_NAME = re.compile(r"(\w+)(?:\[(\d+)(?:\.\.(\d+))?\])?\Z")
+
+@functools.lru_cache(maxsize=NODE_NAME_CACHE_SIZE)
+def _parse_node_name(name):
+  m = SIMPLE_NODE_NAME.match(name)
+  if m:
+    component, start, end = m.groups()
+    if start is None: return ((component, None),)
+    if end is None: return ((component, (int(start),)),)
+    return ((component, (int(start), int(end))),)
+  return tuple(get_node_name_parser().parseString(name, parseAll=True).asList())
 
 def parse_node_name(name):
   """ Parse name in Quartus notation, returning a list of (name, subscript) tuples,
       where subscript is either None (no subscript found), or a (start[, end]) tuple. """
-  return node_name_parser.parseString(name, parseAll=True).asList()
+  return list(_parse_node_name(name))
 
 def get_type_width(parsed_name):
   get_component_width = lambda x: abs(x[1][0]-x[1][1])+1 if x[1] and len(x[1]) > 1 else 1
   return sum(map(get_component_width, parsed_name))
 
+@functools.lru_cache(maxsize=NODE_NAME_CACHE_SIZE)
+def get_name_width(name):
+  """ Equivalent to get_type_width(parse_node_name(name)), memoized. """
+  return get_type_width(_parse_node_name(name))
+
+def node_name_cache_info():
+  """ Returns hit / miss statistics of the node name caches. """
+  return {"names": _parse_node_name.cache_info(), "widths": get_name_width.cache_info()}
+
+def clear_node_name_cache():
+  _parse_node_name.cache_clear()
+  get_name_width.cache_clear()
+
 def render_node_name(name, options):
   def render_component(component):
     name, subscript = component
@@ -286,60 +516,86 @@ def render_node_name(name, options):
     if subscript and len(subscript) == 2:
       return "\\nodenamerange{%s}{%d}{%d}" % (render_tikz_text(name, options), subscript[0], subscript[1])
     return "\\nodenamebit{%s}" % (render_tikz_text(name, options))
-  return "$%s$" % " ".join(map(render_component, parse_node_name(name)))
+  return "$%s$" % " ".join(map(render_component, _parse_node_name(name)))
 
 # Line rendering (lines is a list of (p1, p2, width, is_input, no_output, has_output))
 
-def join_widths(point, w1, w2):
+def join_widths(point, w1, w2, mismatches=None):
+  # if a mismatches list is passed, inconsistencies are appended there as
+  # (point, w1, w2) instead of printed
   if w1 and w2 and w1 != w2:
-    print("WARNING: widths inconsistent on point %s: %d vs %d" % (str(point), w1, w2))
+    if mismatches is not None: mismatches.append((point, w1, w2))
+    else: print("WARNING: widths inconsistent on point %s: %d vs %d" % (str(point), w1, w2))
   if w1 is None or (w2 != None and w1 < w2): w1 = w2
   return w1
 
 def render_all_lines(lines, options):
+  options = get_context(options)
+  return "".join(map(lambda x: render_line_run(x,options), trace_line_runs(lines)))
+
+def trace_line_runs(lines):
   # It's important to draw series of connectors "in a single run",
   # rather than many segments, so group them in runs, where each
   # run is a { "points": [(x,y), (x,y)...], "width": [N], "arrow": [bool, bool], "has_output": [bool], "output_forbidden": [bool, bool] } dictionary
   runs = []
 
-  def process_end(run, arrow, output_forbidden):
-    run["arrow"][1] = arrow
-    point = run["points"][-1]
-    neighbors = {}
-
-    def process(line):
-      sides = {line[0], line[1]}
-      if point not in sides: return True
-
-      sides.remove(point)
-      neighbors[next(iter(sides))] = (line[3], line[4])
-      run["width"][0] = join_widths(point, run["width"][0], line[2])
-      run["has_output"][0] = run["has_output"][0] or line[5]
-      return False
-    lines[:] = [line for line in lines if process(line)]
-
-    if len(neighbors) == 1 and not run["arrow"][1]:
-      neighbor = next(iter(neighbors))
-      run["points"].append(neighbor)
-      return process_end(run, neighbors[neighbor][0], neighbors[neighbor][1])
-    run["output_forbidden"][1] = output_forbidden or (len(neighbors) > 0)
-    for neighbor in neighbors:
-      new_run = start_run(point, neighbor, run["width"], neighbors[neighbor][0], neighbors[neighbor][1], run["has_output"])
-      new_run["output_forbidden"][0] = True
-
-  def start_run(start, to, width, arrow, output_forbidden, has_output):
-    run = { "points": [start, to], "width": width, "arrow": [False, False], "has_output": has_output, "output_forbidden": [False, False] }
+  # Index lines by their endpoints, so that the lines meeting at a point
+  # can be found (and removed) without scanning the whole list.
+  # Each entry keeps the line indexes in their original order.
+  incident = {}
+  for i, line in enumerate(lines):
+    incident.setdefault(line[0], []).append(i)
+    if line[1] != line[0]: incident.setdefault(line[1], []).append(i)
+  removed = [False] * len(lines)
+
+  def extend_run(run, arrow, output_forbidden):
+    # Follow the run from its last point for as long as there's a single
+    # way to continue it, then return the branches found at its end
+    while True:
+      run["arrow"][1] = arrow
+      point = run["points"][-1]
+      neighbors = {}
+
+      # all remaining lines on this point get consumed here
+      for i in incident.pop(point, ()):
+        if removed[i]: continue
+        removed[i] = True
+        line = lines[i]
+        neighbors[line[1] if line[0] == point else line[0]] = (line[3], line[4])
+        run["width"][0] = join_widths(point, run["width"][0], line[2])
+        run["has_output"][0] = run["has_output"][0] or line[5]
+
+      if len(neighbors) == 1 and not run["arrow"][1]:
+        neighbor = next(iter(neighbors))
+        run["points"].append(neighbor)
+        arrow, output_forbidden = neighbors[neighbor]
+        continue
+      run["output_forbidden"][1] = output_forbidden or (len(neighbors) > 0)
+      return [(point, neighbor) + neighbors[neighbor] for neighbor in neighbors]
+
+  def trace_run(run, arrow, output_forbidden):
+    # Branches are traced depth-first, in the order they were found, using
+    # an explicit stack so that long chains don't hit the recursion limit.
+    # Every branch shares its width and has_output with the root run.
+    pending = extend_run(run, arrow, output_forbidden)[::-1]
+    while len(pending):
+      start, to, arrow, output_forbidden = pending.pop()
+      new_run = { "points": [start, to], "width": run["width"], "arrow": [False, False], "has_output": run["has_output"], "output_forbidden": [True, False] }
+      runs.append(new_run)
+      pending += extend_run(new_run, arrow, output_forbidden)[::-1]
+
+  # lines are taken from the end, like popping from the list
+  for i in reversed(range(len(lines))):
+    if removed[i]: continue
+    removed[i] = True
+    line = lines[i]
+    run = { "points": [line[0], line[1]], "width": [line[2]], "arrow": [False, False], "has_output": [line[5]], "output_forbidden": [False, False] }
     runs.append(run)
-    process_end(run, arrow, output_forbidden)
-    return run
-
-  while len(lines):
-    line = lines.pop()
-    run = start_run(line[0], line[1], [line[2]], line[3], line[4], [line[5]])
+    trace_run(run, line[3], line[4])
     run["points"].reverse()
     run["arrow"].reverse()
     run["output_forbidden"].reverse()
-    process_end(run, False, False)
+    trace_run(run, False, False)
 
     # for code quality: reverse so that arrow is always -> if possible
     if run["arrow"] == [True, False]:
@@ -347,20 +603,71 @@ def render_all_lines(lines, options):
       run["arrow"].reverse()
       run["output_forbidden"].reverse()
 
-  return "".join(map(lambda x: render_line_run(x,options), runs))
+  del lines[:]
+  return runs
+
+def simplify_run_points(points):
+  """ Drop repeated points, and points in the middle of a straight stretch
+      (where the run continues in the same direction). Ends are kept. """
+  result = [points[0]]
+  for point in points[1:]:
+    if point == result[-1]: continue
+    if len(result) >= 2:
+      a, b = result[-2], result[-1]
+      d1 = (b[0] - a[0], b[1] - a[1])
+      d2 = (point[0] - b[0], point[1] - b[1])
+      if d1[0] * d2[1] == d1[1] * d2[0] and d1[0] * d2[0] + d1[1] * d2[1] > 0:
+        result[-1] = point
+        continue
+    result.append(point)
+  if len(result) == 1: result.append(points[-1])
+  return result
+
+def get_path_operators(points):
+  """ TikZ operators joining consecutive points: an horizontal segment
+      followed by a vertical one is joined as `-|` (skipping the corner),
+      a vertical one followed by an horizontal one as `|-`, and the
+      rest with `--`. Returns (operators, points) with the corners removed. """
+  operators, result = [], [points[0]]
+  i = 0
+  while i + 1 < len(points):
+    a, b = points[i], points[i+1]
+    if i + 2 < len(points):
+      c = points[i+2]
+      if a[1] == b[1] and a[0] != b[0] and b[0] == c[0] and b[1] != c[1]:
+        operators.append("-|")
+        result.append(c)
+        i += 2
+        continue
+      if a[0] == b[0] and a[1] != b[1] and b[1] == c[1] and b[0] != c[0]:
+        operators.append("|-")
+        result.append(c)
+        i += 2
+        continue
+    operators.append("--")
+    result.append(b)
+    i += 1
+  return operators, result
 
 def render_line_run(run, options):
-  # FIXME: remove unnecessary intermediary points (if feature enabled) and use |- syntax
+  options = get_context(options)
   points = run["points"]
   width = run["width"][0]
   if width is None:
     print("WARNING: No known type for %s run, defaulting to node" % str(points[0]))
     width = 1
   assert len(points) >= 2 and width >= 1
-  contents = " -- ".join(map(lambda x: render_tikz_point(x, options), points))
+  if options.options.get("simplify_runs"):
+    points = simplify_run_points(points)
+  if options.options.get("orthogonal_runs"):
+    operators, points = get_path_operators(points)
+    formatted = render_tikz_points(points, options)
+    contents = formatted[0] + "".join(" %s %s" % pair for pair in zip(operators, formatted[1:]))
+  else:
+    contents = " -- ".join(render_tikz_points(points, options))
   arguments = [("node" if width == 1 else "bus") + " line"]
   arrow = run["arrow"]
-  if run["has_output"][0] and options["connector_output_arrows"]:
+  if run["has_output"][0] and options.options["connector_output_arrows"]:
     arrow = [a or (not o) for a, o in zip(run["arrow"], run["output_forbidden"])]
   if arrow != [False, False]:
     re = ("<" if arrow[0] else "") + "-" + (">" if arrow[1] else "")
@@ -369,15 +676,23 @@ def render_line_run(run, options):
 
 # Pin rendering
 
+PIN_CONNECTIONS = {"output": (52,8), "input": (120.5,8)}
+
+def get_pin_line(pin):
+  """ Returns the (entry, connection) points, in sheet coordinates, of the
+      line joining a pin to the lines connected to it. """
+  connection = get_point_transform(pin)(PIN_CONNECTIONS[pin.direction])
+  connection = (connection[0] + pin.bounds.x1, connection[1] + pin.bounds.y1)
+  entry = (pin.p.x + pin.bounds.x1, pin.p.y + pin.bounds.y1)
+  return entry, connection
+
 def render_pin(lines, pin, options):
   name = pin.name.text
   if pin.direction == "output":
-    connection = (52,8)
     text_point = (82,8)
     text_anchor = "west"
     drawing = [(52,4), (78,4), (82,8), (78,12), (52,12)]
   elif pin.direction == "input":
-    connection = (120.5,8)
     text_point = (92,8)
     text_anchor = "east"
     drawing = [(92,12), (117,12), (121,8), (117,4), (92,4)]
@@ -385,30 +700,27 @@ def render_pin(lines, pin, options):
     print("WARNING: don't know how to render %s pin drawing" % pin.direction)
     return None
 
-  noptions = dict(options)
-  noptions["offset"] = (options["offset"][0] + pin.bounds.x1, options["offset"][1] + pin.bounds.y1)
+  options = get_context(options)
+  noptions = options.derive(offset=(options.offset[0] + pin.bounds.x1, options.offset[1] + pin.bounds.y1))
   statements = []
 
   # (apply transform to drawing if needed)
   transform = get_point_transform(pin)
-  connection = transform(connection)
   text_point = transform(text_point)
-  drawing = list(map(transform, drawing))
   text_anchor = transform_text_anchor(pin, text_anchor)
 
   # Draw bounds
   contents = "%s rectangle %s" % (render_tikz_point((0,0), noptions), render_tikz_point((pin.bounds.x2 - pin.bounds.x1, pin.bounds.y2 - pin.bounds.y1), noptions))
-  if options["render_pin_bounds"]:
+  if options.options["render_pin_bounds"]:
     statements += [render_tikz_statement(["pin bounds"], contents, noptions)]
 
   # Create connection line
-  connection = (connection[0] + pin.bounds.x1, connection[1] + pin.bounds.y1)
-  entry = (pin.p.x + pin.bounds.x1, pin.p.y + pin.bounds.y1)
-  width = get_type_width(parse_node_name(name))
+  entry, connection = get_pin_line(pin)
+  width = get_name_width(name)
   lines.append((entry, connection, width, False, True, pin.direction == "input"))
 
   # Pin drawing itself
-  contents = " -- ".join(list(map(lambda x: render_tikz_point(x, noptions), drawing)) + ["cycle"])
+  contents = " -- ".join(render_tikz_points(drawing, noptions, pin) + ["cycle"])
   arguments = [pin.direction + " pin"]
   statements += [render_tikz_statement(arguments, contents, noptions)]
 
@@ -439,54 +751,112 @@ def is_primitive(symbol):
       return False
   return True
 
-def render_symbol(lines, symbol, options):
+# Symbol bodies (type text and drawing) shared by several instances can be
+# defined once as a TikZ pic, then placed at each instance.
+
+def get_symbol_body_key(symbol, primitive):
+  """ Hashable value identifying the body of a symbol, and how it's drawn. """
+  def freeze(value):
+    if isinstance(value, parser.ParseObject) and not isinstance(value, parser.Point):
+      return (type(value).__name__,) + tuple(freeze(v) for v in value.get_attributes().values())
+    return value
+  return (primitive, freeze(symbol.typeText), tuple(map(freeze, symbol.drawing)), symbol.mirror, symbol.rotation)
+
+class SymbolTemplates(object):
+  """ Keeps track of the bodies repeated among the passed symbols,
+      and the pics defined for them so far. """
+  def __init__(self, symbols):
+    self.keys = {}
+    counts = {}
+    for symbol in symbols:
+      key = self.keys[id(symbol)] = get_symbol_body_key(symbol, is_primitive(symbol))
+      counts[key] = counts.get(key, 0) + 1
+    self.repeated = {key for key in counts if counts[key] > 1}
+    self.names = {}
+
+  def lookup(self, symbol):
+    """ Returns (pic name, whether it has to be defined now) for the body of
+        symbol, or None if it's not repeated. """
+    key = self.keys.get(id(symbol))
+    if key not in self.repeated: return None
+    if key in self.names: return self.names[key], False
+    self.names[key] = "symbol body %d" % len(self.names)
+    return self.names[key], True
+
+def render_symbol_body(symbol, primitive, options):
+  options = get_context(options)
+  statements = []
+
+  # Draw symbol type
+  if (not primitive or symbol.typeText.text in ["VCC"]) and not symbol.typeText.invisible:
+    noptions = options.derive(extra_args=options.extra_args + ["symbol type"])
+    statements += [render_text(symbol.typeText, noptions)]
+
+  # Drawing itself
+  noptions = options.derive(extra_args=options.extra_args + ["primitive" if primitive else "symbol"])
+  statements += render_graphic_objects([o for o in symbol.drawing if not (hasattr(o, "invisible") and o.invisible)], noptions)
+
+  return "".join(statements)
+
+def render_symbol(lines, symbol, options, templates=None):
   statements = []
-  noptions = dict(options)
-  noptions["offset"] = (noptions["offset"][0] + symbol.bounds.x1, noptions["offset"][1] + symbol.bounds.y1)
+  options = get_context(options)
+  noptions = options.derive(offset=(options.offset[0] + symbol.bounds.x1, options.offset[1] + symbol.bounds.y1))
   primitive = is_primitive(symbol)
 
   # Draw bounds
   contents = "%s rectangle %s" % (render_tikz_point((0,0), noptions), render_tikz_point((symbol.bounds.x2 - symbol.bounds.x1, symbol.bounds.y2 - symbol.bounds.y1), noptions))
-  if options["render_primitive_bounds" if primitive else "render_symbol_bounds"]:
+  if options.options["render_primitive_bounds" if primitive else "render_symbol_bounds"]:
     statements += [render_tikz_statement(["symbol bounds"], contents, noptions)]
 
-  # Draw symbol type
-  if (not primitive or symbol.typeText.text in ["VCC"]) and not symbol.typeText.invisible:
-    noptions["extra_args"] = options["extra_args"] + ["symbol type"]
-    statements += [render_text(symbol.typeText, noptions)]
+  # Symbol type and drawing, as a pic if the body is repeated
+  template = templates.lookup(symbol) if templates else None
+  if template:
+    name, define = template
+    if define:
+      body_options = options.derive(offset=(0, 0))
+      statements += [render_tikz_pic_definition(name, render_symbol_body(symbol, primitive, body_options), options)]
+    statements += [render_tikz_pic(name, (0, 0), noptions)]
+  else:
+    statements += [render_symbol_body(symbol, primitive, noptions)]
 
-  # Drawing itself
-  noptions["extra_args"] = options["extra_args"] + ["primitive" if primitive else "symbol"]
-  statements += [render_graphic_object(o, noptions) for o in symbol.drawing if not (hasattr(o, "invisible") and o.invisible)]
+  # Process ports: snap names first, then anchor the rest at once
+  port_name_transform = lambda x: render_node_name(x, options)
+  port_options = {}
+  for port in symbol.ports:
+    if not port.text2.invisible:
+      port_options[id(port)] = noptions.derive(extra_args=options.extra_args + ["port name"], text_anchor="center", text_transform=port_name_transform)
+  unsnapped = [port for port in symbol.ports if id(port) in port_options and not snap_port_name(port, port_options[id(port)])]
+  if unsnapped and options.options["anchor_ports"]:
+    anchors = calculate_optimal_anchors_to_lines([(port.text2.bounds, port.text2.vertical, port.line) for port in unsnapped])
+    for port, anchor in zip(unsnapped, anchors):
+      port_options[id(port)]["text_anchor"] = anchor
 
-  # Process ports
   for port in symbol.ports:
     if port.text1.text != port.text2.text:
       print("WARNING: port on symbol %s has different texts: \"%s\" and \"%s\". picking the last one" % (symbol.name.text, port.text1.text, port.text2.text))
     
     if not port.text2.invisible:
-      noptions["extra_args"] = options["extra_args"] + ["port name"]
-      noptions["text_transform"] = lambda x: render_node_name(x, options)
-      noptions["text_anchor"] = "center"
-      if snap_port_name(port, noptions):
-        pass
-      elif options["anchor_ports"]:
-        noptions["text_anchor"] = calculate_optimal_anchor_to_line(port.text2.bounds, port.text2.vertical, port.line)
-      statements += [render_text(port.text2, noptions)]
-
-    p = (port.p.x + symbol.bounds.x1, port.p.y + symbol.bounds.y1)
-    p1 = (port.line.p1.x + symbol.bounds.x1, port.line.p1.y + symbol.bounds.y1) 
-    p2 = (port.line.p2.x + symbol.bounds.x1, port.line.p2.y + symbol.bounds.y1)
-    pts = {p1, p2}
-    pts.remove(p)
-    p2 = next(iter(pts))
-    width = get_type_width(parse_node_name(port.text2.text)) if not primitive else None
-    can_have_arrow = options["port_arrows_if_invisible"] or not port.text2.invisible
-    arrow = port.direction == "input" and options["port_input_arrows"] and can_have_arrow
+      statements += [render_text(port.text2, port_options[id(port)])]
+
+    p, p2 = get_port_line(symbol, port)
+    width = get_name_width(port.text2.text) if not primitive else None
+    can_have_arrow = options.options["port_arrows_if_invisible"] or not port.text2.invisible
+    arrow = port.direction == "input" and options.options["port_input_arrows"] and can_have_arrow
     lines.append((p, p2, width, arrow, True, port.direction == "output"))
 
   return "".join(statements)
 
+def get_port_line(symbol, port):
+  """ Returns the (connection point, inner end) points, in sheet coordinates,
+      of the line of a symbol port. """
+  p = (port.p.x + symbol.bounds.x1, port.p.y + symbol.bounds.y1)
+  p1 = (port.line.p1.x + symbol.bounds.x1, port.line.p1.y + symbol.bounds.y1) 
+  p2 = (port.line.p2.x + symbol.bounds.x1, port.line.p2.y + symbol.bounds.y1)
+  pts = {p1, p2}
+  pts.remove(p)
+  return p, next(iter(pts))
+
 def snap_port_name(port, options):
   distance = options["port_name_n_distance"]
   if distance is False or distance is None: return
@@ -494,8 +864,8 @@ def snap_port_name(port, options):
   normal_limit = options["port_name_n_snap"]
 
   # determine inner point
-  line_points = { (port.line.p1.x, port.line.p1.y), (port.line.p2.x, port.line.p2.y) }
-  line_points.remove((port.p.x, port.p.y))
+  line_points = { port.line.p1, port.line.p2 }
+  line_points.remove(port.p)
   point = next(iter(line_points))
 
   # line should be horizontal or vertical
@@ -534,34 +904,31 @@ def snap_port_name(port, options):
 # Little things: connectors, junctions...
 
 def render_connector(lines, connector, options):
-  p1 = (connector.p1.x, connector.p1.y)
-  p2 = (connector.p2.x, connector.p2.y)
+  options = get_context(options)
+  p1, p2 = connector.p1, connector.p2
   width = None
   if connector.label:
     name = connector.label.text
     try:
-      width = get_type_width(parse_node_name(name))
-    except pyparsing.ParseException as e:
+      width = get_name_width(name)
+    except node_name_errors() as e:
       if not (name.startswith("<<") and name.endswith(">>")):
         print("WARNING: Couldn't parse \"%s\", ignoring" % name)
   lines.append((p1, p2, width, False, False, False))
   # FIXME: it'd be nice to verify, at the end, that bus matched run width
 
   if connector.label:
-    noptions = dict(options)
-    noptions["extra_args"] = options["extra_args"] + ["line name"]
-    noptions["text_transform"] = lambda x: render_node_name(x, options)
-    if options["anchor_labels"]:
+    noptions = options.derive(extra_args=options.extra_args + ["line name"], text_transform=lambda x: render_node_name(x, options))
+    if options.options["anchor_labels"]:
       noptions["text_anchor"] = calculate_optimal_anchor_to_line(connector.label.bounds, connector.label.vertical, parser.Line(connector.p1, connector.p2, None))
     try:
       return render_text(connector.label, noptions)
-    except pyparsing.ParseException as e:
+    except node_name_errors() as e:
       if not (name.startswith("<<") and name.endswith(">>")):
         print("WARNING: Couldn't parse \"%s\", ignoring" % name)
 
 def render_junction(junction, options):
-  p = (junction.p.x, junction.p.y)
-  contents = "%s node[contact] {}" % (render_tikz_point(p, options),)
+  contents = "%s node[contact] {}" % (render_tikz_point(junction.p, options),)
   arguments = ["junction"]
   return render_tikz_statement(arguments, contents, options)
 
@@ -0,0 +1,139 @@
+# Copyright 2016 Alba Mendez <me@alba.sh>
+#
+# This file is part of bdf2tikz.
+#
+# bdf2tikz is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# bdf2tikz is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with bdf2tikz.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Conversion daemon, so that editor previews and build hooks converting a
+file on every save don't pay for interpreter startup and imports, and
+reuse the warm node name caches (and render cache, if any).
+
+Requests and responses are JSON objects, one per line, read from a Unix
+domain socket (see serve_socket and the client in client.py) or from
+stdin (see serve_stream). A request is:
+
+    {"id": any, "input": path, "output": path, "options": {...}}
+
+where output is optional (the rendered TikZ is then returned as "result")
+and options override the default ones. The response is:
+
+    {"id": any, "ok": true, "output": path, "elapsed": seconds, "warnings": [...]}
+
+or, on failure, {"id": any, "ok": false, "error": traceback, ...}.
+Requests are handled one at a time.
+"""
+
+import os
+import io
+import socket
+import sys
+import json
+import time
+import signal
+import traceback
+import contextlib
+import socketserver
+from .process import render_bdf, map_input, default_options
+from .batch import convert_file
+from .client import get_default_socket
+
+def handle_request(request, cache=None):
+  """ Perform a conversion request (a dict), returning the response dict. """
+  response = {"id": request.get("id")}
+  start = time.perf_counter()
+  warnings = io.StringIO()
+  try:
+    options = dict(default_options)
+    options.update(request.get("options") or {})
+    # warnings are printed by the renderer, keep them out of our stdout
+    with contextlib.redirect_stdout(warnings):
+      if request.get("output"):
+        _, output, _, error = convert_file(request["input"], request["output"], options, cache)
+        response["output"] = output
+      else:
+        with map_input(request["input"]) as rs:
+          response["result"] = render_bdf(rs, options, cache)
+        error = None
+  except Exception:
+    error = traceback.format_exc()
+  response["ok"] = error is None
+  if error is not None: response["error"] = error
+  response["elapsed"] = time.perf_counter() - start
+  response["warnings"] = warnings.getvalue().splitlines()
+  return response
+
+def handle_line(line, cache=None):
+  """ Parse a request line, and return the response line (with newline). """
+  try:
+    request = json.loads(line)
+    if not isinstance(request, dict) or "input" not in request:
+      raise ValueError("request must be an object with an input path")
+  except ValueError as e:
+    response = {"id": None, "ok": False, "error": "Invalid request: %s" % e, "warnings": []}
+  else:
+    response = handle_request(request, cache)
+  return json.dumps(response) + "\n"
+
+def serve_stream(input=sys.stdin, output=sys.stdout, cache=None):
+  """ Serve requests read from a text stream, until end of file. """
+  for line in input:
+    if not line.strip(): continue
+    output.write(handle_line(line, cache))
+    output.flush()
+
+class RequestHandler(socketserver.StreamRequestHandler):
+  def handle(self):
+    for line in self.rfile:
+      if not line.strip(): continue
+      self.wfile.write(handle_line(line.decode("utf-8"), self.server.cache).encode("utf-8"))
+      self.wfile.flush()
+
+class Server(socketserver.UnixStreamServer):
+  def __init__(self, path, cache=None):
+    self.cache = cache
+    socketserver.UnixStreamServer.__init__(self, path, RequestHandler)
+
+class ServerRunning(Exception):
+  pass
+
+def remove_stale_socket(path):
+  """ Remove the socket at path if it was left behind by a server that is
+      no longer running. Raises ServerRunning if one answers there. """
+  with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+    try:
+      probe.connect(path)
+    except FileNotFoundError:
+      return
+    except ConnectionRefusedError:
+      os.remove(path)
+      return
+  raise ServerRunning("a server is already listening on %s" % path)
+
+def serve_socket(path=None, cache=None):
+  """ Serve requests on a Unix domain socket (until interrupted or terminated). A socket
+      left behind by a previous server is replaced, but if another server is
+      still running there, ServerRunning is raised. """
+  path = path or get_default_socket()
+  remove_stale_socket(path)
+  server = Server(path, cache)
+  # exit cleanly (removing the socket) when terminated
+  signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+  try:
+    server.serve_forever()
+  except KeyboardInterrupt:
+    pass
+  finally:
+    server.server_close()
+    os.remove(path)
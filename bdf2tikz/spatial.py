@@ -0,0 +1,121 @@
+# Copyright 2016 Alba Mendez <me@alba.sh>
+#
+# This file is part of bdf2tikz.
+#
+# bdf2tikz is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# bdf2tikz is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with bdf2tikz.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Spatial index over the line segments of a sheet (connectors, and the
+lines of pins and ports), to relate points and areas to segments without
+scanning all of them.
+
+Segments are bucketed in a uniform grid: each one is added to every cell
+its bounding box overlaps, and queries only test the segments of the cells
+they overlap.
+"""
+
+def contains(a, b, p):
+  """ Whether point p lies on the segment from a to b (ends included). """
+  if not (min(a[0], b[0]) <= p[0] <= max(a[0], b[0]) and min(a[1], b[1]) <= p[1] <= max(a[1], b[1])):
+    return False
+  return (b[0] - a[0]) * (p[1] - a[1]) == (b[1] - a[1]) * (p[0] - a[0])
+
+def crosses(a, b, x1, y1, x2, y2):
+  """ Whether the segment from a to b intersects the rectangle (edges included). """
+  if max(a[0], b[0]) < x1 or min(a[0], b[0]) > x2 or max(a[1], b[1]) < y1 or min(a[1], b[1]) > y2:
+    return False
+  # the bounding boxes overlap, so it crosses unless the whole
+  # rectangle is strictly on one side of the line
+  dx, dy = b[0] - a[0], b[1] - a[1]
+  sides = [dx * (y - a[1]) - dy * (x - a[0]) for x, y in ((x1, y1), (x1, y2), (x2, y1), (x2, y2))]
+  return not (all(s > 0 for s in sides) or all(s < 0 for s in sides))
+
+def choose_cell_size(segments, minimum=8):
+  """ Median extent of the segments, so that most of them span few cells. """
+  extents = sorted(max(abs(b[0] - a[0]), abs(b[1] - a[1])) for a, b in segments)
+  if not extents: return minimum
+  return max(minimum, int(extents[len(extents) // 2]))
+
+class SegmentIndex(object):
+  """ Grid index over a list of segments. Each segment is a tuple whose
+      first two items are its points (so the lines collected while rendering,
+      or (p1, p2, payload) tuples, can be passed directly). Queries return
+      the indexes of the matching segments, in increasing order. """
+  def __init__(self, segments, cell_size=None):
+    self.segments = [(s[0], s[1]) for s in segments]
+    self.cell_size = cell_size or choose_cell_size(self.segments)
+    self.cells = {}
+    for i, (a, b) in enumerate(self.segments):
+      for cell in self.get_cells(min(a[0], b[0]), min(a[1], b[1]), max(a[0], b[0]), max(a[1], b[1])):
+        self.cells.setdefault(cell, []).append(i)
+
+  def get_cells(self, x1, y1, x2, y2):
+    size = self.cell_size
+    for cx in range(int(x1 // size), int(x2 // size) + 1):
+      for cy in range(int(y1 // size), int(y2 // size) + 1):
+        yield (cx, cy)
+
+  def candidates(self, x1, y1, x2, y2):
+    """ Indexes of segments in the cells overlapping the rectangle. """
+    result = set()
+    for cell in self.get_cells(x1, y1, x2, y2):
+      result.update(self.cells.get(cell, ()))
+    return result
+
+  def touching(self, point):
+    """ Segments on which the point lies (ends included). """
+    segments = self.segments
+    return sorted(i for i in self.candidates(point[0], point[1], point[0], point[1]) if contains(segments[i][0], segments[i][1], point))
+
+  def crossing(self, x1, y1, x2, y2):
+    """ Segments intersecting the rectangle (edges included). """
+    segments = self.segments
+    return sorted(i for i in self.candidates(x1, y1, x2, y2) if crosses(segments[i][0], segments[i][1], x1, y1, x2, y2))
+
+def split_t_junctions(lines):
+  """ Split connector segments at the ends of other segments landing in
+      their interior (T connections), so that runs are traced through them.
+      Only plain connector segments (without arrow, not part of a pin or
+      port) are split. Returns a new list in the same order, with each split
+      segment replaced by its pieces, from its first point to its second. """
+  index = SegmentIndex(lines)
+  splits = {}
+  for point in dict.fromkeys(p for line in lines for p in line[:2]):
+    for i in index.touching(point):
+      line = lines[i]
+      if point == line[0] or point == line[1] or line[3] or line[4]: continue
+      splits.setdefault(i, []).append(point)
+
+  result = []
+  for i, line in enumerate(lines):
+    points = splits.get(i)
+    if points is None:
+      result.append(line)
+      continue
+    a = line[0]
+    points.sort(key=lambda p: (p[0] - a[0]) ** 2 + (p[1] - a[1]) ** 2)
+    points = [a] + points + [line[1]]
+    result += [(p, q) + line[2:] for p, q in zip(points, points[1:])]
+  return result
+
+def find_point_runs(points, runs):
+  """ For each of the points (i.e. junctions), the indexes of the runs
+      passing through it. A run is a traced run (see render.trace_line_runs)
+      or a sequence of points. """
+  segments = []
+  for r, run in enumerate(runs):
+    run = run["points"] if isinstance(run, dict) else run
+    segments += [(a, b, r) for a, b in zip(run, run[1:])]
+  index = SegmentIndex(segments)
+  return [sorted({segments[i][2] for i in index.touching(p)}) for p in points]
@@ -1 +1 @@
-__all__ = ["sexp"]
+__all__ = ["sexp", "lexer", "synthetic"]
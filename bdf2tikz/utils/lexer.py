@@ -0,0 +1,126 @@
+# Copyright 2016 Alba Mendez <me@alba.sh>
+#
+# This file is part of bdf2tikz.
+#
+# bdf2tikz is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# bdf2tikz is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with bdf2tikz.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Single-pass S-expression parser for the subset used by BDF / BSF files.
+
+Produces exactly the same nested lists as the pyparsing grammar in `sexp`
+(lists, quoted strings with quotes removed, ints, floats and tokens), but
+in linear time. Syntax outside that subset (raw, base64 or hexadecimal
+strings, display hints) raises `UnsupportedSyntax`, so that the caller can
+fall back to the full grammar.
+
+The input can be a str, or a bytes-like object (bytes, a memoryview or an
+mmap of the file) which is tokenized in place, without decoding it first.
+"""
+
+import re
+
+class SexpError(Exception):
+  def __init__(self, reason, position):
+    Exception.__init__(self, u"%s at position %d" % (reason, position))
+    self.position = position
+
+class UnsupportedSyntax(SexpError):
+  pass
+
+STRING_PATTERN = r'"((?:[^"\n\r\\]|""|\\(?:[^x]|x[0-9a-fA-F]+))*)"'
+
+# Alternatives are tried in the same order as `simpleString` in the grammar,
+# so that adjacent atoms (i.e. `12abc`) are split the same way.
+TOKEN_PATTERN = r"""[ \t\r\n]*(?:
+  (\() |
+  (\)) |
+  %s |
+  ([+-]?\d+\.\d*(?:[eE][+-]?\d+)?) |
+  (\d+[ \t\r\n]*:|[|#\[\]]) |
+  (-?(?:0|[1-9]\d*)) |
+  ([A-Za-z0-9\-./_:*+=!<>]+) |
+  ([^ \t\r\n])
+)""" % STRING_PATTERN
+TOKEN_RE = re.compile(TOKEN_PATTERN, re.X)
+TOKEN_RE_BYTES = re.compile(TOKEN_PATTERN.encode("ascii"), re.X)
+
+OPEN, CLOSE, STRING, REAL, UNSUPPORTED, DECIMAL, TOKEN, INVALID = range(1, 9)
+
+def parse_sexps(input, start=0):
+  """ Parse a string or bytes-like object containing zero or more S-expressions
+      (from offset start), returning them as a list. Strings and tokens
+      are always returned as str. Bytes must be ASCII. """
+  binary = not isinstance(input, str)
+  stack = []
+  current = []
+  for m in (TOKEN_RE_BYTES if binary else TOKEN_RE).finditer(input, start):
+    kind = m.lastindex
+    if kind == OPEN:
+      stack.append(current)
+      current = []
+    elif kind == CLOSE:
+      if not stack: raise SexpError(u"Unbalanced closing parenthesis", m.start(kind))
+      parent = stack.pop()
+      parent.append(current)
+      current = parent
+    elif kind == STRING or kind == TOKEN:
+      current.append(m.group(kind).decode("ascii") if binary else m.group(kind))
+    elif kind == DECIMAL:
+      current.append(int(m.group(kind)))
+    elif kind == REAL:
+      current.append(float(m.group(kind)))
+    elif kind == UNSUPPORTED:
+      raise UnsupportedSyntax(u"Unsupported S-expression syntax", m.start(kind))
+    else:
+      raise SexpError(u"Unexpected character %r" % m.group(kind), m.start(kind))
+  if stack: raise SexpError(u"Unterminated list", len(input))
+  return current
+
+# strings (which may contain parenthesis) and parenthesis
+SPLIT_RE = re.compile((r"%s|[()]" % STRING_PATTERN).encode("ascii"))
+
+def split_sexps(input, start=0):
+  """ Returns the (start, end) offsets of the top level S-expressions in a
+      bytes-like object, without tokenizing their contents. Only lists are
+      supported at the top level. """
+  spans = []
+  depth = 0
+  for m in SPLIT_RE.finditer(input, start):
+    c = input[m.start()]
+    if c == 0x28:
+      if depth == 0:
+        if input[start:m.start()].strip(): raise UnsupportedSyntax(u"Atom at top level", start)
+        start = m.start()
+      depth += 1
+    elif c == 0x29:
+      if depth == 0: raise SexpError(u"Unbalanced closing parenthesis", m.start())
+      depth -= 1
+      if depth == 0:
+        spans.append((start, m.end()))
+        start = m.end()
+  if depth: raise SexpError(u"Unterminated list", len(input))
+  if input[start:].strip(): raise UnsupportedSyntax(u"Atom at top level", start)
+  return spans
+
+LINE_START_RE = re.compile(rb"\n\(")
+
+def split_lines(input, start=0):
+  """ Faster, approximate version of split_sexps: returns the (start, end)
+      offsets of the chunks of a bytes-like object that begin with an opening
+      parenthesis at the start of a line, which is how Quartus writes the
+      top level S-expressions. Since strings can't span lines, chunks are
+      always split between tokens, but a chunk may hold several S-expressions
+      (or part of one, if a nested list starts a line). """
+  offsets = [start] + [m.start() + 1 for m in LINE_START_RE.finditer(input, start)] + [len(input)]
+  return list(zip(offsets, offsets[1:]))
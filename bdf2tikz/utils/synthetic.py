@@ -0,0 +1,212 @@
+# Copyright 2016 Alba Mendez <me@alba.sh>
+#
+# This file is part of bdf2tikz.
+#
+# bdf2tikz is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# bdf2tikz is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with bdf2tikz.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Generator of synthetic (but valid) Quartus schematics, used for benchmarking.
+
+The generated sheet is a grid of register-like symbols, chained row by row
+through connectors split into several collinear segments, with input pins
+feeding each row and output pins collecting it. Symbol files (BSF) with
+a single such symbol can also be generated, and sheets can be edited
+randomly (i.e. to check incremental rendering).
+"""
+
+import re
+import random
+
+HEADER_COMMENT = u"""/*
+WARNING: Do NOT edit the input and output ports in this file in a text
+editor if you plan to continue editing the block that represents it in
+the Block Editor! File corruption is VERY likely to occur.
+*/
+/*
+Synthetic schematic generated by bdf2tikz.
+*/
+"""
+
+SYMBOL_SIZE = (128, 96)
+CELL_SIZE = (400, 240)
+SYMBOL_FLAGS = [u"rotate90", u"rotate180", u"rotate270", u"flipx", u"flipy", u"flipx_rotate90"]
+
+def _text(text, x1, y1, x2, y2, size=None, flags=()):
+  font = u"(font \"Arial\" (font_size %d))" % size if size else u"(font \"Arial\" )"
+  flags = u"".join(u"(%s)" % f for f in flags)
+  return u"(text \"%s\" (rect %d %d %d %d)%s%s)" % (text, x1, y1, x2, y2, font, flags)
+
+def _line(p1, p2):
+  return u"(line (pt %d %d)(pt %d %d)(line_width 1))" % (p1 + p2)
+
+def _port_name(index, bus_width):
+  if bus_width > 1: return u"d%d[%d..0]" % (index, bus_width - 1)
+  return u"d%d" % index
+
+def _pin(direction, x, y, name, flags):
+  if direction == u"input":
+    p, drawing = (168, 8), [((84,12),(109,12)), ((84,4),(109,4)), ((113,8),(168,8)), ((84,12),(84,4)), ((109,4),(113,8)), ((109,12),(113,8))]
+    type_text = _text(u"INPUT", 125, 0, 153, 10, 6)
+  else:
+    p, drawing = (0, 8), [((0,8),(52,8)), ((52,4),(78,4)), ((52,12),(78,12)), ((52,4),(52,12)), ((78,4),(82,8)), ((82,8),(78,12))]
+    type_text = _text(u"OUTPUT", 1, 0, 39, 10, 6)
+  result = [u"(pin", u"\t(%s)" % direction, u"\t(rect %d %d %d %d)" % (x, y, x + 168, y + 16)]
+  result += [u"\t" + type_text, u"\t" + _text(name, 5, 0, 60, 12)]
+  result += [u"\t(pt %d %d)" % p, u"\t(drawing"]
+  result += [u"\t\t" + _line(a, b) for a, b in drawing]
+  result += [u"\t)", u"\t(annotation_block (location)(rect %d %d %d %d))" % (x - 56, y + 16, x, y + 32)]
+  result += [u"\t(%s)" % f for f in flags]
+  result += [u")"]
+  return result, (x + p[0], y + p[1])
+
+def _symbol(index, x, y, inputs, outputs, bus_width, primitive, flags):
+  """ Returns (lines, input port points, output port points), points are absolute. """
+  w, h = SYMBOL_SIZE
+  result = [u"(symbol", u"\t(rect %d %d %d %d)" % (x, y, x + w, y + h)]
+  if primitive:
+    result += [u"\t" + _text(u"AND%d" % inputs, 0, 0, 25, 10, 6, [u"invisible"])]
+  else:
+    result += [u"\t" + _text(u"reg%d" % bus_width, 40, 1, 80, 13, 8)]
+  result += [u"\t" + _text(u"inst%d" % index, 3, h - 11, 30, h)]
+  in_points, out_points = [], []
+  for side, count, points in ((u"input", inputs, in_points), (u"output", outputs, out_points)):
+    for i in range(count):
+      py = 16 + (h - 32) * (i + 1) // (count + 1)
+      if side == u"input": p, inner = (0, py), (16, py)
+      else: p, inner = (w, py), (w - 16, py)
+      name = _port_name(i, bus_width)
+      tx = 20 if side == u"input" else w - 60
+      hidden = [u"invisible"] if primitive else []
+      result += [u"\t(port", u"\t\t(pt %d %d)" % p, u"\t\t(%s)" % side]
+      result += [u"\t\t" + _text(name, 0, 0, 30, 11, 8, hidden)]
+      result += [u"\t\t" + _text(name, tx, py - 6, tx + 40, py + 5, 8, hidden)]
+      result += [u"\t\t" + _line(p, inner), u"\t)"]
+      points.append((x + p[0], y + p[1]))
+  result += [u"\t(drawing"]
+  if primitive:
+    result += [u"\t\t" + _line((16, 16), (16, h - 16)), u"\t\t" + _line((16, 16), (64, 16)), u"\t\t" + _line((16, h - 16), (64, h - 16))]
+    result += [u"\t\t(arc (pt 64 16)(pt 64 %d)(rect 32 16 96 %d)(line_width 1))" % (h - 16, h - 16)]
+    result += [u"\t\t(circle (rect %d %d %d %d)(line_width 1))" % (w - 24, h // 2 - 4, w - 16, h // 2 + 4)]
+  else:
+    result += [u"\t\t(rectangle (rect 16 16 %d %d)(line_width 1))" % (w - 16, h - 16)]
+  result += [u"\t)"]
+  result += [u"\t(%s)" % f for f in flags]
+  result += [u")"]
+  return result, in_points, out_points
+
+def _route(a, b, segments, label, bus):
+  """ Orthogonal route from a to b, each stretch split into collinear pieces. """
+  mid = (a[0] + b[0]) // 2
+  corners = [a, (mid, a[1]), (mid, b[1]), b]
+  points = [a]
+  for start, end in zip(corners, corners[1:]):
+    if start == end: continue
+    pieces = max(1, segments // 3)
+    for i in range(1, pieces + 1):
+      points.append((start[0] + (end[0] - start[0]) * i // pieces, start[1] + (end[1] - start[1]) * i // pieces))
+  result = []
+  for i, (p1, p2) in enumerate(zip(points, points[1:])):
+    if p1 == p2: continue
+    result += [u"(connector"]
+    if label and i == 0:
+      result += [u"\t" + _text(label, p1[0] + 8, p1[1] - 14, p1[0] + 48, p1[1] - 2)]
+    result += [u"\t(pt %d %d)" % p1, u"\t(pt %d %d)" % p2]
+    if bus: result += [u"\t(bus)"]
+    result += [u")"]
+  return result, points
+
+def generate_bdf(symbols=100, ports=2, segments=6, bus_width=8, transformed=0.25, primitives=0.25, seed=0, version=u"1.4"):
+  """ Generate a synthetic BDF schematic, returned as bytes.
+
+      symbols: number of symbol instances, laid out in a square-ish grid
+      ports: number of input (and output) ports per symbol
+      segments: approximate number of connector segments per route
+      bus_width: width of ports and connectors (1 means single nodes)
+      transformed: fraction of rotated / mirrored pins and symbols
+      primitives: fraction of symbols drawn as primitives (lines, arc, circle) """
+  rng = random.Random(seed)
+  columns = max(1, int(symbols ** .5))
+  out = [HEADER_COMMENT.rstrip(u"\n"), u"(header \"graphic\" (version \"%s\"))" % version]
+  bus = bus_width > 1
+  previous = None
+  for index in range(symbols):
+    row, column = divmod(index, columns)
+    x, y = 240 + column * CELL_SIZE[0], 80 + row * CELL_SIZE[1]
+    flags = [rng.choice(SYMBOL_FLAGS)] if rng.random() < transformed else []
+    primitive = rng.random() < primitives
+    width = 1 if primitive else bus_width
+    lines, in_points, out_points = _symbol(index, x, y, ports, ports, width, primitive, flags)
+    out += lines
+
+    if column == 0:
+      previous = []
+      for i, p in enumerate(in_points):
+        pin_flags = [rng.choice(SYMBOL_FLAGS[:3])] if rng.random() < transformed else []
+        pin, entry = _pin(u"input", x - 232, p[1] - 8 + (i - ports // 2) * 2, u"in%d_%s" % (row, _port_name(i, width)), pin_flags)
+        out += pin
+        previous.append((entry, width))
+    for i, p in enumerate(in_points):
+      source, source_width = previous[i % len(previous)]
+      route_bus = bus and width > 1 and source_width > 1
+      label = _port_name(i, width) if route_bus and rng.random() < .5 else None
+      route, points = _route(source, p, segments, label, route_bus)
+      out += route
+      if len(points) > 3 and rng.random() < .3:
+        # add a T branch with its junction
+        t = points[len(points) // 2]
+        out += [u"(connector", u"\t(pt %d %d)" % t, u"\t(pt %d %d)" % (t[0], t[1] + 24)]
+        if route_bus: out += [u"\t(bus)"]
+        out += [u")", u"(junction (pt %d %d))" % t]
+    previous = [(p, width) for p in out_points]
+
+    if column == columns - 1 or index == symbols - 1:
+      for i, (p, w) in enumerate(previous):
+        pin, entry = _pin(u"output", p[0] + 80, p[1] - 8, u"out%d_%s" % (row, _port_name(i, w)), [])
+        out += pin
+        route, _ = _route(p, entry, segments, None, bus and w > 1)
+        out += route
+
+  out += [_text(u"Synthetic sheet, %d symbols" % symbols, 16, 16, 200, 32, 10, [])]
+  return (u"\n".join(out) + u"\n").encode("ascii")
+
+def generate_bsf(ports=2, bus_width=8, primitive=False, version=u"1.1"):
+  """ Generate a synthetic BSF file (a single symbol), returned as bytes.
+      Arguments are the same as for generate_bdf. """
+  out = [HEADER_COMMENT.rstrip(u"\n"), u"(header \"symbol\" (version \"%s\"))" % version]
+  lines, _, _ = _symbol(0, 16, 16, ports, ports, 1 if primitive else bus_width, primitive, [])
+  out += lines
+  return (u"\n".join(out) + u"\n").encode("ascii")
+
+def edit_randomly(input, rng):
+  """ Returns input with one random edit: a point or rectangle moved, or an
+      object deleted, duplicated or moved elsewhere in the file. The result
+      may be rejected by the renderer (i.e. a port moved off its line). """
+  from . import lexer
+  from ..parser import find_bdf_start
+  spans = lexer.split_sexps(input, find_bdf_start(input))[1:]
+  a, b = rng.choice(spans)
+  kind = rng.randrange(4)
+  if kind == 0:
+    numbers = list(re.finditer(rb"\((?:pt|rect) (-?\d+)", input[a:b]))
+    if numbers:
+      m = rng.choice(numbers)
+      value = b"%d" % (int(m.group(1)) + 8 * rng.choice((-2, -1, 1, 2)))
+      return input[:a+m.start(1)] + value + input[a+m.end(1):]
+  if kind == 1:
+    return input[:a] + input[b:]
+  if kind == 2:
+    return input[:b] + input[a:b] + input[b:]
+  c = rng.choice(spans)[1]
+  if c < a: return input[:c] + input[a:b] + input[c:a] + input[b:]
+  return input[:a] + input[b:c] + input[a:b] + input[c:]
@@ -0,0 +1,240 @@
+# Copyright 2016 Alba Mendez <me@alba.sh>
+#
+# This file is part of bdf2tikz.
+#
+# bdf2tikz is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# bdf2tikz is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with bdf2tikz.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Watch mode: keep the outputs of a project tree up to date while its
+schematics are edited.
+
+Changes are detected with inotify on Linux, or by polling the files
+otherwise. After a change, events are collected until the tree has been
+quiet for a short while (editors may write a file in several steps), then
+only the inputs whose contents changed are rendered again, reusing the
+output of the objects and nets that didn't change (see incremental). Outputs are
+replaced atomically, so readers (i.e. a LaTeX build) never see a partial file.
+"""
+
+import os
+import glob
+import time
+import select
+import struct
+import hashlib
+import traceback
+from .incremental import IncrementalRenderer
+from .process import atomic_output
+from .batch import find_inputs, get_output_path, find_duplicate_outputs, is_input_file
+
+# WATCHERS
+# wait(timeout) blocks until something changes (or timeout seconds pass),
+# and returns the set of changed paths, empty on timeout, or None if
+# anything may have changed.
+
+def get_watched_directories(patterns):
+  """ Directories to watch (recursively) for the passed inputs. """
+  result = []
+  for pattern in patterns:
+    if os.path.isdir(pattern):
+      result.append(pattern)
+      continue
+    # the file's directory, or the part of the pattern before the first wildcard
+    root = pattern
+    while glob.has_magic(root): root = os.path.dirname(root)
+    result.append(os.path.dirname(root) if root == pattern else root)
+  return [os.path.abspath(d or ".") for d in result]
+
+class PollingWatcher(object):
+  def __init__(self, patterns, interval=0.25):
+    self.patterns = patterns
+    self.interval = interval
+    self.stats = self.scan()
+
+  def scan(self):
+    stats = {}
+    for directory in get_watched_directories(self.patterns):
+      for root, dirs, files in os.walk(directory):
+        for name in files:
+          if not is_input_file(name): continue
+          path = os.path.join(root, name)
+          try:
+            stat = os.stat(path)
+          except OSError:
+            continue
+          stats[path] = (stat.st_mtime_ns, stat.st_size)
+    return stats
+
+  def wait(self, timeout=None):
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while True:
+      stats = self.scan()
+      changed = {path for path in set(stats) | set(self.stats) if stats.get(path) != self.stats.get(path)}
+      self.stats = stats
+      if changed: return changed
+      if deadline is not None and time.monotonic() >= deadline: return set()
+      time.sleep(self.interval if deadline is None else max(0, min(self.interval, deadline - time.monotonic())))
+
+  def close(self):
+    pass
+
+# inotify(7) constants
+IN_MODIFY, IN_CLOSE_WRITE, IN_MOVED_FROM, IN_MOVED_TO = 0x2, 0x8, 0x40, 0x80
+IN_CREATE, IN_DELETE, IN_Q_OVERFLOW, IN_ISDIR = 0x100, 0x200, 0x4000, 0x40000000
+IN_EVENT = struct.Struct("iIII")
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+class InotifyWatcher(object):
+  """ Watcher using Linux inotify (through ctypes, so that there are no
+      dependencies). Raises OSError if it isn't available. """
+  def __init__(self, patterns):
+    import ctypes, ctypes.util
+    self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    if not hasattr(self.libc, "inotify_init1"): raise OSError("inotify not available")
+    self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+    if self.fd < 0: raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+    self.directories = {}
+    for directory in get_watched_directories(patterns):
+      self.add_tree(directory)
+
+  def add_tree(self, directory):
+    for root, dirs, files in os.walk(directory):
+      wd = self.libc.inotify_add_watch(self.fd, os.fsencode(root), WATCH_MASK)
+      if wd >= 0: self.directories[wd] = root
+
+  def read_events(self):
+    changed = set()
+    while True:
+      try:
+        data = os.read(self.fd, 65536)
+      except BlockingIOError:
+        return changed
+      offset = 0
+      while offset < len(data):
+        wd, mask, cookie, length = IN_EVENT.unpack_from(data, offset)
+        name = os.fsdecode(data[offset + IN_EVENT.size:offset + IN_EVENT.size + length].rstrip(b"\0"))
+        offset += IN_EVENT.size + length
+        if mask & IN_Q_OVERFLOW: return None
+        if wd not in self.directories: continue
+        path = os.path.join(self.directories[wd], name)
+        if mask & IN_ISDIR:
+          # new (or moved in) directories may already contain inputs
+          if mask & (IN_CREATE | IN_MOVED_TO):
+            self.add_tree(path)
+            for root, dirs, files in os.walk(path):
+              changed.update(os.path.join(root, f) for f in files if is_input_file(f))
+        elif is_input_file(name):
+          changed.add(path)
+
+  def wait(self, timeout=None):
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while True:
+      remaining = None if deadline is None else max(0, deadline - time.monotonic())
+      if not select.select([self.fd], [], [], remaining)[0]: return set()
+      changed = self.read_events()
+      if changed is None or changed: return changed
+
+  def close(self):
+    os.close(self.fd)
+
+def get_watcher(patterns, polling=False):
+  if not polling:
+    try:
+      return InotifyWatcher(patterns)
+    except (OSError, AttributeError):
+      pass
+  return PollingWatcher(patterns)
+
+# REBUILDING
+
+def write_atomically(path, content):
+  directory = os.path.dirname(path)
+  if directory: os.makedirs(directory, exist_ok=True)
+  with atomic_output(path) as f:
+    f.write(content)
+
+class Watch(object):
+  """ Renders the inputs (files, directories or globs, like batch mode)
+      into output_dir, and keeps them up to date with run(). callback is
+      called with (input, output, elapsed seconds, error) for each render,
+      like in batch.convert_batch. """
+  def __init__(self, patterns, output_dir, options, callback=None, debounce=0.05, polling=False):
+    self.patterns = patterns
+    self.output_dir = output_dir
+    self.options = options
+    self.callback = callback
+    self.debounce = debounce
+    self.polling = polling
+    self.hashes = {}
+    self.renderers = {}
+    self.conflicting = set()
+
+  def build(self, changed=None):
+    """ Render the inputs whose contents changed since the last build. If
+        changed is passed, only those paths are considered. """
+    if changed is not None: changed = {os.path.abspath(path) for path in changed}
+    jobs = [(input, get_output_path(relative, self.output_dir)) for input, relative in find_inputs(self.patterns)]
+    present = {os.path.abspath(input) for input, output in jobs}
+    duplicates = find_duplicate_outputs(jobs)
+    # inputs left out by a conflict are retried, since it may be solved
+    retry, self.conflicting = self.conflicting, set()
+    for input, output in jobs:
+      path = os.path.abspath(input)
+      if changed is not None and path not in changed and path not in retry: continue
+      start = time.perf_counter()
+      conflicting = duplicates.get(os.path.normcase(os.path.abspath(output)))
+      if conflicting:
+        # neither input is rendered until the conflict is solved
+        self.hashes.pop(path, None)
+        self.conflicting.add(path)
+        error = "output %s would also be written by %s\n" % (output, ", ".join(i for i in conflicting if i != input))
+        if self.callback: self.callback((input, output, 0, error))
+        continue
+      try:
+        rs = open(input, "rb").read()
+        digest = hashlib.sha256(rs).digest()
+        if self.hashes.get(path) == digest: continue
+        renderer = self.renderers.get(path)
+        if renderer is None: renderer = self.renderers[path] = IncrementalRenderer(self.options)
+        write_atomically(output, renderer.render(rs))
+        self.hashes[path] = digest
+        error = None
+      except Exception:
+        error = traceback.format_exc()
+        self.hashes.pop(path, None)
+      if self.callback: self.callback((input, output, time.perf_counter() - start, error))
+    # forget about deleted inputs
+    for path in set(self.hashes) - present:
+      del self.hashes[path]
+      self.renderers.pop(path, None)
+
+  def run(self):
+    """ Build everything, then rebuild on changes until interrupted. """
+    watcher = get_watcher(self.patterns, self.polling)
+    try:
+      self.build()
+      while True:
+        changed = watcher.wait()
+        # debounce: wait until there are no more events
+        while changed is not None:
+          more = watcher.wait(self.debounce)
+          if more is None or not more:
+            changed = None if more is None else changed
+            break
+          changed |= more
+        self.build(changed)
+    except KeyboardInterrupt:
+      pass
+    finally:
+      watcher.close()
@@ -0,0 +1,357 @@
+#!/usr/bin/env python
+# Copyright 2016 Alba Mendez <me@alba.sh>
+#
+# This file is part of bdf2tikz.
+#
+# bdf2tikz is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# bdf2tikz is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with bdf2tikz.  If not, see <http://www.gnu.org/licenses/>.
+
+# Benchmarks on synthetic schematics.
+# Usage: python bench.py [number of symbols]
+#        python bench.py --report report.json [--sizes 100,1000] [--repeat 3]
+#
+# The second form times every stage separately across sheet sizes and
+# writes the results as JSON, to track regressions over time.
+
+import os
+import io
+import re
+import random
+import sys
+import shutil
+import tempfile
+import threading
+import subprocess
+import json
+import time
+import platform
+import argparse
+import contextlib
+import tracemalloc
+from bdf2tikz import parser, render, spatial, nets, server, client, watch, incremental
+from bdf2tikz.process import default_options, render_bdf
+from bdf2tikz.utils.synthetic import generate_bdf, generate_bsf, edit_randomly
+
+def timed(f, *args):
+  start = time.perf_counter()
+  result = f(*args)
+  return time.perf_counter() - start, result
+
+def bench_sexp_parse(input):
+  start = parser.find_bdf_start(input)
+  fast, result = timed(parser.parse_sexps, input, False, start)
+  print("sexp parse (%d objects): lexer %.3fs" % (len(result), fast), end="")
+  try:
+    strict, strict_result = timed(parser.parse_sexps, input, True, start)
+  except parser.ParseError:
+    print()
+    return
+  assert result == strict_result
+  print(", pyparsing %.3fs (%.1fx speedup)" % (strict, strict / fast))
+
+def count_objects(objects):
+  # count every ParseObject reachable from the passed ones
+  count = 0
+  pending = list(objects)
+  while len(pending):
+    o = pending.pop()
+    if isinstance(o, parser.ParseObject):
+      count += 1
+      pending += o.get_attributes().values()
+    elif isinstance(o, list):
+      pending += o
+  return count
+
+def bench_parse_memory(input):
+  parsed = parser.parse_sexps(input, False, parser.find_bdf_start(input))
+  parser.validate_header(parsed)
+  tracemalloc.start()
+  objects = parser.interpret_bdf(parsed)
+  current, peak = tracemalloc.get_traced_memory()
+  tracemalloc.stop()
+  count = count_objects(objects)
+  print("interpreted objects: %d, %.1f MB retained (%.0f bytes per object), %.1f MB peak" % (count, current / 2.**20, current / float(count), peak / 2.**20))
+
+def bench_lazy_filter(input):
+  parsed = parser.parse_sexps(input, False, parser.find_bdf_start(input))
+  parser.validate_header(parsed)
+  full, _ = timed(parser.interpret_bdf, list(parsed))
+  lazy, pins = timed(lambda: list(parser.LazySchematic(parsed).filter(parser.Pin)))
+  print("interpretation: full %.3fs, only %d pins (lazy) %.3fs" % (full, len(pins), lazy))
+
+def bench_point_formatting(count):
+  points = [(i % 997, i // 997) for i in range(count)]
+  scalar, expected = timed(lambda: [render.render_tikz_point(p, default_options) for p in points])
+  batch, result = timed(render.render_tikz_points, points, default_options)
+  assert result == expected
+  print("point formatting (%d points): scalar %.3fs, batch %.3fs (numpy %s)" % (count, scalar, batch, "enabled" if render.get_numpy() else "not available"))
+
+def bench_anchors(count):
+  # port name anchors, as for a symbol with count ports on its left side
+  labels = [(parser.Bounds(20, 10 + 16 * i, 60, 21 + 16 * i), i % 4 == 0, parser.Line(parser.Point(0, 16 + 16 * i), parser.Point(16, 16 + 16 * i), None)) for i in range(count)]
+  single, _ = timed(lambda: [render.calculate_optimal_anchor_to_line(*label) for label in labels])
+  batch, _ = timed(render.calculate_optimal_anchors_to_lines, labels)
+  print("anchors: %d labels in %.3fs, batched %.3fs" % (count, single, batch))
+
+def bench_long_run(segments):
+  # a single bus route made of many tiny segments, with a branch every
+  # 1000 segments, given in shuffled order (tests/test_render.py checks
+  # the traced runs of the same route)
+  lines = [((i, 0), (i + 1, 0), 8, False, False, False) for i in range(segments)]
+  lines += [((i, 0), (i, 1), None, False, False, False) for i in range(0, segments, 1000)]
+  lines = lines[1::2] + lines[::2]
+  elapsed, runs = timed(render.trace_line_runs, list(lines))
+  rendering, output = timed(lambda: "".join(render.render_line_run(run, default_options) for run in runs))
+  print("run tracing (%d segments): %.3fs, %d runs, rendered in %.3fs" % (segments, elapsed, len(runs), rendering))
+
+def bench_t_junctions(count):
+  # a grid of horizontal wires, with vertical stubs ending on them (T connections)
+  side = int(count ** .5)
+  lines = [((0, 16 * y), (16 * side, 16 * y), 1, False, False, False) for y in range(side)]
+  lines += [((8 + 16 * (i % side), 16 * (i // side)), (8 + 16 * (i % side), 16 * (i // side) + 8), 1, False, False, False) for i in range(count - side)]
+  build, index = timed(spatial.SegmentIndex, lines)
+  query, touching = timed(lambda: [index.touching(line[0]) for line in lines])
+  split, result = timed(spatial.split_t_junctions, lines)
+  print("spatial index (%d segments): build %.3fs, %d point queries %.3fs, T splitting %.3fs (%d segments after)" % (len(lines), build, len(lines), query, split, len(result)))
+
+RUN_MODES = [
+  ("plain runs", {}),
+  ("simplified", {"simplify_runs": True}),
+  ("simplified, |- -|", {"simplify_runs": True, "orthogonal_runs": True}),
+]
+
+def compile_tikz(output):
+  """ Time pdflatex on output wrapped in template.tex, or None if unavailable. """
+  latex = shutil.which("pdflatex")
+  if latex is None: return None
+  template = open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "template.tex")).read()
+  with tempfile.TemporaryDirectory() as directory:
+    with open(os.path.join(directory, "out.tex"), "w") as f: f.write(output)
+    with open(os.path.join(directory, "document.tex"), "w") as f: f.write(template)
+    start = time.perf_counter()
+    subprocess.run([latex, "-interaction=batchmode", "document.tex"], cwd=directory, stdout=subprocess.DEVNULL, check=True)
+    return time.perf_counter() - start
+
+def bench_run_simplification(input):
+  # output size (and LaTeX compile time, if pdflatex is available) of each way of drawing runs
+  for name, options in RUN_MODES:
+    with contextlib.redirect_stdout(io.StringIO()):
+      output = render_bdf(input, dict(default_options, **options))
+    compiled = compile_tikz(output)
+    print("%s: %d bytes, %s" % (name, len(output), "compiled in %.2fs" % compiled if compiled is not None else "pdflatex not available"))
+
+def bench_nets(input):
+  # connectivity only, against full rendering
+  extract, result = timed(lambda: nets.extract_nets(parser.parse_bdf_lazy(input)))
+  with contextlib.redirect_stdout(io.StringIO()):
+    full, _ = timed(render_bdf, input, default_options)
+  unknown = sum(1 for net in result if net.width is None)
+  print("net extraction: %d nets (%d of unknown width) in %.3fs, full render %.3fs" % (len(result), unknown, extract, full))
+
+def bench_server(input, requests=20):
+  # latency of conversions through a warm server, against running main.py
+  with tempfile.TemporaryDirectory() as directory:
+    path = os.path.join(directory, "input.bdf")
+    with open(path, "wb") as f: f.write(input)
+    request = {"input": path, "output": os.path.join(directory, "output.tex")}
+    instance = server.Server(os.path.join(directory, "socket"))
+    threading.Thread(target=instance.serve_forever, daemon=True).start()
+    try:
+      latencies = sorted(timed(client.request, instance.server_address, request)[0] for _ in range(requests))
+    finally:
+      instance.shutdown()
+      instance.server_close()
+    main = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+    cold, _ = timed(lambda: subprocess.run([sys.executable, main, path, request["output"]], stdout=subprocess.DEVNULL))
+  print("server: median request %.1fms (%d requests), main.py %.1fms" % (latencies[len(latencies) // 2] * 1000, requests, cold * 1000))
+
+def bench_watch(input, edits=10):
+  # save-to-output turnaround in watch mode, moving one point on each save
+  with tempfile.TemporaryDirectory() as directory, contextlib.redirect_stdout(io.StringIO()):
+    path = os.path.join(directory, "input", "sheet.bdf")
+    os.mkdir(os.path.dirname(path))
+    with open(path, "wb") as f: f.write(input)
+    done = threading.Event()
+    instance = watch.Watch([os.path.dirname(path)], os.path.join(directory, "output"), default_options, lambda result: done.set())
+    threading.Thread(target=instance.run, daemon=True).start()
+    done.wait()
+    latencies = []
+    for n in range(edits):
+      time.sleep(0.1)
+      done.clear()
+      start = time.perf_counter()
+      with open(path, "wb") as f: f.write(re.sub(rb"\(pt (\d+)", lambda m: b"(pt %d" % (int(m.group(1)) + 8 * (n + 1)), input, count=1))
+      done.wait()
+      latencies.append(time.perf_counter() - start)
+  latencies.sort()
+  print("watch: median save to output %.1fms (%d saves, including %.0fms debounce)" % (latencies[len(latencies) // 2] * 1000, edits, instance.debounce * 1000))
+
+def time_incremental(input, edits=50, seed=0, options=default_options):
+  # average render time after each random edit, full and incremental
+  # (edits that the renderer rejects are skipped; tests/test_incremental.py
+  # checks that the output is the same)
+  rng = random.Random(seed)
+  renderer = incremental.IncrementalRenderer(options)
+  incremental_time = full_time = 0
+  done = 0
+  with contextlib.redirect_stdout(io.StringIO()):
+    renderer.render(input)
+    while done < edits:
+      edited = edit_randomly(input, rng)
+      try:
+        elapsed, _ = timed(render_bdf, edited, options)
+      except Exception:
+        continue
+      input = edited
+      full_time += elapsed
+      incremental_time += timed(renderer.render, input)[0]
+      done += 1
+  return full_time / edits, incremental_time / edits
+
+def bench_incremental(input):
+  for name, options in [("default", default_options), ("templates, T junctions", dict(default_options, symbol_templates=True, split_t_junctions=True))]:
+    full, partial = time_incremental(input, options=options)
+    print("incremental render (%s): full %.3fs, incremental %.3fs (%.1fx)" % (name, full, partial, full / partial))
+
+def bench_parallel_render(input):
+  # object rendering sharded over 1, 2, 4... processes (up to the CPU count)
+  serial, expected = timed(render_bdf, input, default_options)
+  print("render: serial %.3fs" % serial, end="")
+  workers = 2
+  while workers <= (os.cpu_count() or 1):
+    elapsed, result = timed(render_bdf, input, default_options, None, workers)
+    assert result == expected
+    print(", %d workers %.3fs (%.1fx)" % (workers, elapsed, serial / elapsed), end="")
+    workers *= 2
+  print()
+
+# STARTUP
+
+# milliseconds, generous to account for slow machines (it was ~300ms when
+# pyparsing, numpy and every submodule were imported eagerly)
+STARTUP_BUDGET = 60
+
+def measure_startup():
+  """ Import time (in ms) of bdf2tikz.process in a fresh interpreter, measured
+      with python -X importtime. (tests/test_startup.py checks that heavy
+      modules are only imported when needed.) """
+  result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import bdf2tikz.process"], capture_output=True, text=True, check=True)
+  total, started = 0, False
+  for line in result.stderr.splitlines():
+    if not line.startswith("import time:"): continue
+    self_time, cumulative, name = line[len("import time:"):].split("|")
+    if name.strip() == "site": started = True
+    # only top level entries, after the interpreter startup
+    elif started and not name.startswith("  "):
+      total += int(cumulative)
+      if name.strip() == "bdf2tikz.process": break
+  return total / 1000.
+
+def check_startup(budget):
+  elapsed = measure_startup()
+  print("startup: bdf2tikz.process imported in %.1fms (budget %.1fms)" % (elapsed, budget))
+  return elapsed <= budget
+
+# REPORT
+
+def best_of(repeat, f, *args):
+  """ Minimum time of repeat calls (warnings printed by f are discarded). """
+  best = None
+  for _ in range(repeat):
+    with contextlib.redirect_stdout(io.StringIO()):
+      elapsed, result = timed(f, *args)
+    best = elapsed if best is None else min(best, elapsed)
+  return best, result
+
+def time_stages(input, repeat):
+  """ Time parse_bdf and each rendering stage separately on input,
+      returning ({stage: seconds}, {stage: number of items}). """
+  options = render.RenderContext(default_options)
+  timings, counts = {}, {}
+  timings["parse_bdf"], objects = best_of(repeat, parser.parse_bdf, input)
+  counts["parse_bdf"] = len(objects)
+
+  stages = [
+    ("render_pin", parser.Pin, lambda lines, o: render.render_pin(lines, o, options)),
+    ("render_symbol", parser.Symbol, lambda lines, o: render.render_symbol(lines, o, options)),
+    ("render_text", parser.Text, lambda lines, o: render.render_text(o, options)),
+    ("render_connector", parser.Connector, lambda lines, o: render.render_connector(lines, o, options)),
+    ("render_junction", parser.Junction, lambda lines, o: render.render_junction(o, options)),
+  ]
+  all_lines = []
+  for name, type, f in stages:
+    selected = [o for o in objects if isinstance(o, type)]
+    def run():
+      lines = []
+      for o in selected: f(lines, o)
+      return lines
+    timings[name], lines = best_of(repeat, run)
+    counts[name] = len(selected)
+    all_lines += lines
+
+  # render_all_lines consumes its argument
+  timings["render_all_lines"], _ = best_of(repeat, lambda: render.render_all_lines(list(all_lines), options))
+  counts["render_all_lines"] = len(all_lines)
+  timings["render_bdf"], _ = best_of(repeat, render_bdf, input, default_options)
+  return timings, counts
+
+def write_report(path, sizes, repeat):
+  report = {
+    "python": platform.python_version(),
+    "platform": platform.platform(),
+    "numpy": render.get_numpy().__version__ if render.get_numpy() else None,
+    "repeat": repeat,
+    "results": [],
+  }
+  inputs = [("bsf", 1, generate_bsf())] + [("bdf", n, generate_bdf(n)) for n in sizes]
+  for kind, symbols, input in inputs:
+    timings, counts = time_stages(input, repeat)
+    report["results"].append({"kind": kind, "symbols": symbols, "bytes": len(input), "timings": timings, "counts": counts})
+    print("%s, %d symbols: %s" % (kind, symbols, ", ".join("%s %.4fs" % i for i in sorted(timings.items()))), file=sys.stderr)
+  if path == "-":
+    json.dump(report, sys.stdout, indent=2, sort_keys=True)
+  else:
+    with open(path, "w") as f:
+      json.dump(report, f, indent=2, sort_keys=True)
+
+if __name__ == "__main__":
+  args = argparse.ArgumentParser(description="Benchmark bdf2tikz on synthetic schematics.")
+  args.add_argument("symbols", nargs="?", type=int, default=1000, help="size of the sheet (default: %(default)s)")
+  args.add_argument("--report", metavar="FILE", help="time each stage across sizes, writing JSON to FILE (- for stdout)")
+  args.add_argument("--sizes", default="10,100,1000", help="comma separated sheet sizes for --report (default: %(default)s)")
+  args.add_argument("--startup-budget", type=float, metavar="MS", help="only check that importing bdf2tikz.process takes less than MS milliseconds (exit status 1 otherwise)")
+  args.add_argument("--repeat", type=int, default=3, help="repetitions for --report, the best is kept (default: %(default)s)")
+  args = args.parse_args()
+  if args.startup_budget is not None:
+    sys.exit(0 if check_startup(args.startup_budget) else 1)
+  if args.report:
+    write_report(args.report, [int(n) for n in args.sizes.split(",")], args.repeat)
+    sys.exit(0)
+
+  check_startup(STARTUP_BUDGET)
+  symbols = args.symbols
+  input = generate_bdf(symbols)
+  print("synthetic sheet: %d symbols, %d bytes" % (symbols, len(input)))
+  bench_sexp_parse(input)
+  bench_parse_memory(input)
+  bench_lazy_filter(input)
+  bench_point_formatting(100000)
+  bench_anchors(100000)
+  bench_long_run(100000)
+  bench_t_junctions(50000)
+  bench_run_simplification(input)
+  bench_nets(input)
+  bench_server(generate_bdf(10))
+  bench_watch(input)
+  bench_incremental(input)
+  bench_parallel_render(input)
@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+# Copyright 2016 Alba Mendez <me@alba.sh>
+#
+# This file is part of bdf2tikz.
+#
+# bdf2tikz is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# bdf2tikz is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with bdf2tikz.  If not, see <http://www.gnu.org/licenses/>.
+
+# Thin client for a running conversion daemon (python main.py --serve),
+# with the same interface as main.py for single files.
+
+import os
+import sys
+import argparse
+from bdf2tikz.client import request, get_default_socket
+
+def main():
+  parser = argparse.ArgumentParser(description="Convert a Quartus schematic to TikZ, using a running bdf2tikz server.")
+  parser.add_argument("input", help="input file")
+  parser.add_argument("output", help="output file")
+  parser.add_argument("--socket", default=get_default_socket(), help="socket of the server (default: %(default)s)")
+  args = parser.parse_args()
+
+  response = request(args.socket, {"input": os.path.abspath(args.input), "output": os.path.abspath(args.output)})
+  for warning in response.get("warnings", ()):
+    print(warning)
+  if not response["ok"]:
+    print(response["error"], file=sys.stderr)
+    return 1
+  return 0
+
+if __name__ == "__main__":
+  sys.exit(main())
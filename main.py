@@ -17,8 +17,95 @@
 # along with bdf2tikz.  If not, see <http://www.gnu.org/licenses/>.
 
 import sys
-from bdf2tikz.process import render_bdf, default_options
+import json
+import time
+import argparse
+from bdf2tikz.process import render_bdf_to, map_input, atomic_output, default_options
+from bdf2tikz import batch
+from bdf2tikz.client import get_default_socket
+from bdf2tikz.profile import Profile
 
-rs = open(sys.argv[1],"rb").read()
-output = render_bdf(rs, default_options)
-open(sys.argv[2], "w").write(output)
+# the server, watch and cache modules are only imported when their mode or
+# option is used, so that plain conversions start fast
+
+def print_result(result):
+  input, output, elapsed, error = result
+  if error:
+    print("FAILED %s (%.3fs):\n%s" % (input, elapsed, error), file=sys.stderr)
+  else:
+    print("%8.3fs  %s -> %s" % (elapsed, input, output))
+
+def positive_int(value):
+  number = int(value)
+  if number < 1: raise argparse.ArgumentTypeError("must be at least 1, got %d" % number)
+  return number
+
+def main():
+  parser = argparse.ArgumentParser(description="Convert Quartus schematics to TikZ.", usage=
+    "%(prog)s <BDF file> out.tex\n"
+    "       %(prog)s -o <output dir> [-j N] <file, directory or glob>...\n"
+    "       %(prog)s -o <output dir> --watch <file, directory or glob>...\n"
+    "       %(prog)s --serve [socket | -]")
+  parser.add_argument("inputs", nargs="*", help="input file and output file, or (with -o) inputs to convert")
+  parser.add_argument("-o", "--output-dir", help="batch mode: convert every input into this directory, mirroring the input tree")
+  parser.add_argument("-j", "--jobs", type=positive_int, default=None, help="batch mode: number of worker processes (default: one per CPU)")
+  parser.add_argument("--cache", metavar="DIR", help="reuse output of unchanged inputs, cached in this directory")
+  parser.add_argument("--render-jobs", type=int, default=1, metavar="N", help="single file mode: render objects of the sheet in N processes (0: one per CPU)")
+  parser.add_argument("--cache-size", type=int, default=256, metavar="MB", help="maximum size of the cache (default: %(default)s MB)")
+  parser.add_argument("--profile", action="store_true", help="single file mode: print the time spent in each stage to stderr")
+  parser.add_argument("--profile-json", metavar="FILE", help="single file mode: write the time spent in each stage as JSON (- for stdout)")
+  parser.add_argument("--serve", nargs="?", const="", metavar="SOCKET", help="run a conversion server on a Unix socket (default: %s), or on stdin / stdout if '-', see client.py" % get_default_socket())
+  parser.add_argument("--watch", action="store_true", help="batch mode: keep running, and render inputs again when they change")
+  parser.add_argument("--poll", action="store_true", help="watch mode: poll for changes instead of using inotify")
+  args = parser.parse_args()
+  cache = None
+  if args.cache:
+    from bdf2tikz.cache import RenderCache
+    cache = RenderCache(args.cache, args.cache_size * 1024 * 1024)
+
+  if args.serve == "-":
+    from bdf2tikz import server
+    server.serve_stream(cache=cache)
+    return 0
+  if args.serve is not None:
+    from bdf2tikz import server
+    try:
+      server.serve_socket(args.serve or None, cache)
+    except server.ServerRunning as e:
+      print("error: %s" % e, file=sys.stderr)
+      return 1
+    return 0
+
+  if args.output_dir is None:
+    if args.watch: parser.error("--watch needs an output directory (-o)")
+    if len(args.inputs) != 2: parser.error("expected an input and an output file")
+    profile = Profile() if args.profile or args.profile_json else None
+    with map_input(args.inputs[0]) as rs, atomic_output(args.inputs[1]) as output:
+      render_bdf_to(output, rs, default_options, cache, args.render_jobs or None, profile)
+    if args.profile:
+      print(profile.format(), file=sys.stderr)
+    if args.profile_json == "-":
+      json.dump(profile.report(), sys.stdout, indent=2)
+    elif args.profile_json:
+      with open(args.profile_json, "w") as f:
+        json.dump(profile.report(), f, indent=2)
+    return 0
+
+  if args.watch:
+    from bdf2tikz import watch
+    print("Watching for changes, press Ctrl+C to stop.")
+    watch.Watch(args.inputs, args.output_dir, default_options, print_result, polling=args.poll).run()
+    return 0
+
+  jobs = [(input, batch.get_output_path(relative, args.output_dir)) for input, relative in batch.find_inputs(args.inputs)]
+  duplicates = batch.find_duplicate_outputs(jobs)
+  if duplicates:
+    parser.error("several inputs would be written to the same output:\n" + "\n".join("  %s: %s" % (output, ", ".join(inputs)) for output, inputs in sorted(duplicates.items())))
+  start = time.perf_counter()
+  results = batch.convert_batch(jobs, default_options, args.jobs, print_result, cache)
+  failed = sum(1 for r in results if r[3])
+  print("%d files converted, %d failed, in %.3fs (%.3fs summed over files)" % (len(results) - failed, failed, time.perf_counter() - start, sum(r[2] for r in results)))
+  return 1 if failed else 0
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -0,0 +1,61 @@
+# Copyright 2016 Alba Mendez <me@alba.sh>
+#
+# This file is part of bdf2tikz.
+#
+# bdf2tikz is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# bdf2tikz is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with bdf2tikz.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+from bdf2tikz import batch
+from bdf2tikz.cache import RenderCache
+from bdf2tikz.process import render_bdf, default_options
+from bdf2tikz.utils.synthetic import generate_bdf
+
+class CountingCache(RenderCache):
+  """ Records each scan of the directory in a log file, which works
+      across worker processes. """
+  def __init__(self, directory, log, max_size):
+    RenderCache.__init__(self, directory, max_size)
+    self.log = log
+  def evict(self):
+    with open(self.log, "a") as f: f.write("scan\n")
+    RenderCache.evict(self)
+
+def count_scans(log):
+  return len(open(log).read().splitlines()) if os.path.exists(log) else 0
+
+def test_scans_once_until_full(tmp_path):
+  log = str(tmp_path / "log")
+  cache = CountingCache(str(tmp_path / "cache"), log, 100 * 1000)
+  for i in range(200):
+    cache.put("key%d" % i, "x" * 1000)
+  entries = os.listdir(str(tmp_path / "cache"))
+  # one scan per 10% of the limit written, and the newest entries are kept
+  assert count_scans(log) <= 1 + 200 // 10
+  assert sum(os.path.getsize(os.path.join(str(tmp_path / "cache"), name)) for name in entries) <= 100 * 1000
+  assert "key199.tex" in entries and "key0.tex" not in entries
+  assert cache.get("key199") == "x" * 1000
+
+def test_batch_workers_scan_once(tmp_path):
+  jobs = []
+  for i in range(12):
+    input = tmp_path / ("sheet%d.bdf" % i)
+    input.write_bytes(generate_bdf(2 + i))
+    jobs.append((str(input), str(tmp_path / "out" / ("sheet%d.tex" % i))))
+  log = str(tmp_path / "log")
+  cache = CountingCache(str(tmp_path / "cache"), log, 256 * 1024 * 1024)
+  results = batch.convert_batch(jobs, default_options, 2, cache=cache)
+  assert not any(result[3] for result in results)
+  assert count_scans(log) <= 2
+  for input, output in jobs:
+    assert open(output).read() == render_bdf(open(input, "rb").read(), default_options)
@@ -0,0 +1,60 @@
+# Copyright 2016 Alba Mendez <me@alba.sh>
+#
+# This file is part of bdf2tikz.
+#
+# bdf2tikz is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# bdf2tikz is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with bdf2tikz.  If not, see <http://www.gnu.org/licenses/>.
+
+import random
+import pytest
+from bdf2tikz.incremental import IncrementalRenderer
+from bdf2tikz.process import render_bdf, default_options
+from bdf2tikz.utils.synthetic import generate_bdf, edit_randomly
+
+OPTIONS = {
+  "default": default_options,
+  "templates": dict(default_options, symbol_templates=True, split_t_junctions=True, simplify_runs=True),
+}
+
+def valid_edits(input, rng, count, options):
+  """ Yields (edited input, full render) for count random edits in a row,
+      skipping edits that the renderer rejects. """
+  done = 0
+  while done < count:
+    edited = edit_randomly(input, rng)
+    try:
+      expected = render_bdf(edited, options)
+    except Exception:
+      continue
+    input = edited
+    done += 1
+    yield input, expected
+
+@pytest.mark.parametrize("options", sorted(OPTIONS))
+@pytest.mark.parametrize("symbols,seed", [(3, 3), (3, 7), (10, 4), (10, 5), (20, 0), (20, 1)])
+def test_matches_full_render(symbols, seed, options):
+  options = OPTIONS[options]
+  input = generate_bdf(symbols, seed=seed)
+  renderer = IncrementalRenderer(options)
+  assert renderer.render(input) == render_bdf(input, options)
+  for n, (input, expected) in enumerate(valid_edits(input, random.Random(seed), 30, options)):
+    assert renderer.render(input) == expected, "differs after edit %d" % n
+
+def test_recovers_after_error():
+  # a rejected version doesn't break the following ones
+  input = generate_bdf(10)
+  renderer = IncrementalRenderer(default_options)
+  renderer.render(input)
+  with pytest.raises(Exception):
+    renderer.render(input + b"(")
+  assert renderer.render(input) == render_bdf(input, default_options)
@@ -0,0 +1,61 @@
+# Copyright 2016 Alba Mendez <me@alba.sh>
+#
+# This file is part of bdf2tikz.
+#
+# bdf2tikz is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# bdf2tikz is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with bdf2tikz.  If not, see <http://www.gnu.org/licenses/>.
+
+from bdf2tikz import parser, render, spatial
+from bdf2tikz.nets import extract_nets, get_unjoined_junctions
+from bdf2tikz.utils.synthetic import generate_bdf
+
+# a vertical connector ending in the middle of an horizontal one, with a junction
+T_SHEET = b"""(header "graphic" (version "1.4"))
+(connector (pt 0 0) (pt 64 0))
+(connector (pt 32 0) (pt 32 32))
+(junction (pt 32 0))
+"""
+
+def test_t_junction_unjoined():
+  nets = extract_nets(parser.parse_bdf(T_SHEET))
+  assert len(nets) == 2
+  assert all(net.junctions == [(32, 0)] for net in nets)
+  unjoined = get_unjoined_junctions(nets)
+  assert list(unjoined) == [(32, 0)] and len(unjoined[(32, 0)]) == 2
+
+def test_t_junction_split():
+  nets = extract_nets(parser.parse_bdf(T_SHEET), split_t=True)
+  assert len(nets) == 1 and nets[0].junctions == [(32, 0)]
+  assert get_unjoined_junctions(nets) == {}
+
+def test_synthetic_junctions():
+  # each junction is listed in the nets with a segment through it
+  schematic = parser.parse_bdf_lazy(generate_bdf(50))
+  junctions = [j.p for j in schematic.filter(parser.Junction)]
+  assert junctions
+  nets = extract_nets(schematic)
+  for point in junctions:
+    expected = [net for net in nets if any(spatial.contains(a, b, point) for a, b in net.segments)]
+    assert expected and [net for net in nets if point in net.junctions] == expected
+  unjoined = get_unjoined_junctions(nets)
+  assert all(len([net for net in nets if point in net.junctions]) > 1 for point in unjoined)
+
+def test_find_point_runs():
+  lines = [((0, 0), (64, 0), 1, False, False, False), ((64, 0), (64, 32), 1, False, False, False), ((100, 0), (120, 0), 1, False, False, False)]
+  runs = render.trace_line_runs(list(lines))
+  found = spatial.find_point_runs([(32, 0), (64, 16), (110, 0), (200, 200)], runs)
+  first = [i for i, run in enumerate(runs) if (0, 0) in run["points"]]
+  other = [i for i, run in enumerate(runs) if (100, 0) in run["points"]]
+  assert found == [first, first, other, []]
+  # plain point sequences work too
+  assert spatial.find_point_runs([(5, 5)], [[(0, 0), (10, 10)], [(0, 10), (10, 0)]]) == [[0, 1]]
@@ -0,0 +1,79 @@
+# Copyright 2016 Alba Mendez <me@alba.sh>
+#
+# This file is part of bdf2tikz.
+#
+# bdf2tikz is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# bdf2tikz is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with bdf2tikz.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import sys
+import threading
+import subprocess
+from bdf2tikz.process import map_input, render_bdf, default_options
+from bdf2tikz.utils.synthetic import generate_bdf
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def test_map_input_regular_and_empty(tmp_path):
+  path = tmp_path / "sheet.bdf"
+  path.write_bytes(generate_bdf(3))
+  with map_input(str(path)) as rs:
+    assert bytes(rs) == generate_bdf(3)
+  path.write_bytes(b"")
+  with map_input(str(path)) as rs:
+    assert bytes(rs) == b""
+
+def test_map_input_fifo(tmp_path):
+  path = str(tmp_path / "fifo")
+  os.mkfifo(path)
+  input = generate_bdf(3)
+  def write():
+    with open(path, "wb") as f: f.write(input)
+  writer = threading.Thread(target=write)
+  writer.start()
+  with map_input(path) as rs:
+    assert bytes(rs) == input
+  writer.join()
+
+def test_main_reads_pipe(tmp_path):
+  input = generate_bdf(3)
+  output = tmp_path / "out.tex"
+  subprocess.run([sys.executable, os.path.join(ROOT, "main.py"), "/dev/stdin", str(output)], input=input, stdout=subprocess.DEVNULL, check=True)
+  assert output.read_text() == render_bdf(input, default_options)
+
+def test_main_rejects_invalid_jobs(tmp_path):
+  for jobs in ("0", "-1"):
+    result = subprocess.run([sys.executable, os.path.join(ROOT, "main.py"), "-o", str(tmp_path), "-j", jobs, str(tmp_path)], capture_output=True, text=True)
+    assert result.returncode == 2 and "must be at least 1" in result.stderr
+
+def test_main_keeps_output_on_error(tmp_path):
+  output = tmp_path / "out.tex"
+  output.write_text("previous")
+  input = tmp_path / "broken.bdf"
+  input.write_bytes(generate_bdf(3)[:-20])
+  result = subprocess.run([sys.executable, os.path.join(ROOT, "main.py"), str(input), str(output)], capture_output=True)
+  assert result.returncode != 0
+  assert output.read_text() == "previous"
+  # and no temporary file is left behind
+  assert sorted(os.listdir(str(tmp_path))) == ["broken.bdf", "out.tex"]
+
+def test_main_output_mode(tmp_path):
+  input = tmp_path / "sheet.bdf"
+  input.write_bytes(generate_bdf(3))
+  output = tmp_path / "out.tex"
+  umask = os.umask(0o022)
+  try:
+    subprocess.run([sys.executable, os.path.join(ROOT, "main.py"), str(input), str(output)], stdout=subprocess.DEVNULL, check=True)
+  finally:
+    os.umask(umask)
+  assert os.stat(str(output)).st_mode & 0o777 == 0o644
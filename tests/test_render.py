@@ -0,0 +1,106 @@
+# Copyright 2016 Alba Mendez <me@alba.sh>
+#
+# This file is part of bdf2tikz.
+#
+# bdf2tikz is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# bdf2tikz is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with bdf2tikz.  If not, see <http://www.gnu.org/licenses/>.
+
+import sys
+import math
+import random
+import pytest
+from bdf2tikz import render, parser
+
+def long_route(segments):
+  # a single bus route made of many tiny segments, with a branch every
+  # 1000 segments, given in shuffled order
+  lines = [((i, 0), (i + 1, 0), 8, False, False, False) for i in range(segments)]
+  lines += [((i, 0), (i, 1), None, False, False, False) for i in range(0, segments, 1000)]
+  return lines[1::2] + lines[::2]
+
+@pytest.mark.parametrize("segments", [500, 2500, 20000])
+def test_trace_long_route(segments):
+  lines = long_route(segments)
+  # tracing must not recurse along the route
+  limit = sys.getrecursionlimit()
+  sys.setrecursionlimit(100)
+  try:
+    runs = render.trace_line_runs(list(lines))
+  finally:
+    sys.setrecursionlimit(limit)
+
+  # runs end at the tips and at the branch points (not at the first branch,
+  # where the route continues into it): 2 per branch, minus one
+  branches = len(range(0, segments, 1000))
+  assert len(runs) == 2 * branches - 1
+  traced = []
+  for run in runs:
+    points = run["points"]
+    assert len(set(points)) == len(points), "run goes back over itself"
+    xs = [p[0] for p in points]
+    assert xs == sorted(xs) or xs == sorted(xs, reverse=True), "run points out of order"
+    assert run["width"] == [8]
+    traced += [frozenset(pair) for pair in zip(points, points[1:])]
+  assert len(traced) == len(lines), "segments repeated"
+  assert set(traced) == {frozenset(line[:2]) for line in lines}, "segments lost"
+
+def sorted_anchor_to_line(bounds, vertical, line):
+  # the implementation before the anchor tables, sorting every anchor
+  def distance_to_segment(a, b, x):
+    subtract = lambda a, b: (a[0]-b[0], a[1]-b[1])
+    dot = lambda a, b: a[0]*b[0] + a[1]*b[1]
+    norm = lambda a: math.sqrt(dot(a, a))
+    distance = lambda a, b: norm(subtract(a, b))
+    map = lambda x, start, end: start + x * (end - start)
+
+    l = distance(a, b)
+    if l == 0: return distance(a, x)
+    t = max(0, min(1, dot(subtract(x,a), subtract(b,a)) / l))
+    projection = (map(t, a[0], b[0]), map(t, a[1], b[1]))
+    return distance(x, projection)
+
+  p1, p2 = line.p1, line.p2
+  anchors = render.TEXT_ANCHORS.keys()
+  anchors = sorted(anchors, key=lambda anchor: distance_to_segment(p1, p2, render.calculate_anchor_point(bounds, vertical, anchor)) + 1*(abs(render.TEXT_ANCHORS[anchor][0]) + abs(render.TEXT_ANCHORS[anchor][1])))
+  return anchors[0]
+
+@pytest.mark.parametrize("seed", range(4))
+def test_optimal_anchors_match_sorting(seed):
+  rng = random.Random(seed)
+  def coordinate():
+    # mostly integer and half coordinates, which give ties
+    r = rng.random()
+    if r < .4: return rng.randrange(-40, 40)
+    if r < .7: return rng.randrange(-40, 40) * .5
+    return rng.uniform(-40, 40)
+  labels = []
+  for _ in range(5000):
+    bounds = parser.Bounds(coordinate(), coordinate(), coordinate(), coordinate())
+    p1 = (coordinate(), coordinate())
+    r = rng.random()
+    if r < .1: p2 = p1
+    elif r < .4: p2 = (p1[0], coordinate())
+    elif r < .6: p2 = (coordinate(), p1[1])
+    else: p2 = (coordinate(), coordinate())
+    labels.append((bounds, rng.choice([False, True, None]), parser.Line(p1, p2, None)))
+  expected = [sorted_anchor_to_line(*label) for label in labels]
+  assert render.calculate_optimal_anchors_to_lines(labels) == expected
+  assert [render.calculate_optimal_anchor_to_line(*label) for label in labels] == expected
+
+def test_optimal_anchor_ties():
+  # a label centered above a horizontal line: every anchor on the bottom edge
+  # is at the same distance, the penalty and then the table order decide
+  bounds = parser.Bounds(0, 10, 8, 14)
+  for vertical in (False, True):
+    for line in (parser.Line((-4, 8), (12, 8), None), parser.Line((4, 8), (4, 8), None), parser.Line((4, 0), (4, 20), None)):
+      assert render.calculate_optimal_anchor_to_line(bounds, vertical, line) == sorted_anchor_to_line(bounds, vertical, line)
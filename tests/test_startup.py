@@ -0,0 +1,43 @@
+# Copyright 2016 Alba Mendez <me@alba.sh>
+#
+# This file is part of bdf2tikz.
+#
+# bdf2tikz is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# bdf2tikz is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with bdf2tikz.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import sys
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def imported_after(code):
+  """ Runs code in a fresh interpreter, returning the modules it imported. """
+  code += "\nimport sys\nprint(' '.join(sys.modules))"
+  result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+  return set(result.stdout.split())
+
+def test_small_file_imports_no_heavy_modules():
+  modules = imported_after(
+    "import bdf2tikz.process as process\n"
+    "from bdf2tikz.utils.synthetic import generate_bsf\n"
+    "process.render_bdf(generate_bsf(), process.default_options)")
+  assert not modules & {"pyparsing", "numpy", "concurrent.futures"}
+
+def test_package_imports_submodules_lazily():
+  modules = imported_after("import bdf2tikz")
+  assert not {m for m in modules if m.startswith("bdf2tikz.")}
+
+def test_main_imports_modes_lazily():
+  modules = imported_after("import main")
+  assert not modules & {"bdf2tikz.server", "bdf2tikz.watch", "bdf2tikz.cache", "socketserver"}
@@ -0,0 +1,50 @@
+# Copyright 2016 Alba Mendez <me@alba.sh>
+#
+# This file is part of bdf2tikz.
+#
+# bdf2tikz is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# bdf2tikz is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with bdf2tikz.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+from bdf2tikz.watch import Watch
+from bdf2tikz.process import render_bdf, default_options
+from bdf2tikz.utils.synthetic import generate_bdf
+
+def test_build_writes_readable_outputs(tmp_path):
+  (tmp_path / "in").mkdir()
+  (tmp_path / "in" / "a.bdf").write_bytes(generate_bdf(3))
+  results = []
+  umask = os.umask(0o022)
+  try:
+    Watch([str(tmp_path / "in")], str(tmp_path / "out"), default_options, results.append).build()
+  finally:
+    os.umask(umask)
+  output = str(tmp_path / "out" / "a.tex")
+  assert [r[3] for r in results] == [None]
+  assert open(output).read() == render_bdf(generate_bdf(3), default_options)
+  assert os.stat(output).st_mode & 0o777 == 0o644
+
+def test_build_skips_conflicts_until_solved(tmp_path):
+  for directory in ("in1", "in2"):
+    (tmp_path / directory).mkdir()
+    (tmp_path / directory / "a.bdf").write_bytes(generate_bdf(3))
+  results = []
+  watch = Watch([str(tmp_path / "in1"), str(tmp_path / "in2")], str(tmp_path / "out"), default_options, results.append)
+  watch.build()
+  assert len(results) == 2 and all(r[3] for r in results)
+  assert not os.path.exists(str(tmp_path / "out" / "a.tex"))
+  # removing one of them solves the conflict, and the other one is rendered
+  os.remove(str(tmp_path / "in2" / "a.bdf"))
+  del results[:]
+  watch.build({str(tmp_path / "in2" / "a.bdf")})
+  assert [(r[0], r[3]) for r in results] == [(str(tmp_path / "in1" / "a.bdf"), None)]